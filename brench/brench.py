@@ -4,24 +4,52 @@
 import click
 import tomlkit
 import subprocess
+import collections
 import re
 import csv
 import sys
 import os
 from concurrent import futures
+import functools
 import glob
+import hashlib
+import json
+import shlex
+import queue
+import shutil
+import statistics
+import threading
+import time
 
-__version__ = '1.0.0'
+__version__ = '1.1.0'
 
 ARGS_RE = r'ARGS: (.*)'
 
+# The extra CSV columns for timing statistics (see `summarize`).
+TIMING_COLUMNS = ['wall_mean', 'wall_stddev', 'wall_min',
+                  'cpu_mean', 'cpu_stddev', 'cpu_min', 'maxrss']
+
+
+def feed(pipe, data):
+    """Write a string to a pipe and close it, ignoring a reader that has
+    already gone away.
+    """
+    try:
+        pipe.write(data)
+        pipe.close()
+    except (BrokenPipeError, ValueError):
+        pass
+
 
 def run_pipe(cmds, input, timeout):
     """Execute a pipeline of shell commands.
 
     Send the given input (text) string into the first command, then pipe
     the output of each command into the next command in the sequence.
-    Collect and return the stdout and stderr from the final command.
+    Collect and return the stdout and stderr from the final command, and
+    the resources every command used, as a list of (CPU seconds, maximum
+    resident set size in KiB) pairs. Raise `subprocess.TimeoutExpired`
+    if the pipeline takes longer than `timeout` seconds.
     """
     procs = []
     for cmd in cmds:
@@ -34,18 +62,300 @@ def run_pipe(cmds, input, timeout):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE if last else subprocess.DEVNULL,
         )
+        if procs:
+            procs[-1].stdout.close()  # Only the next command reads it.
         procs.append(proc)
 
+    deadline = time.monotonic() + timeout
+    outputs = {}
+
+    def collect(key, pipe):
+        outputs[key] = pipe.read()
+
+    # Send stdin and collect stdout and stderr, all at once, so no pipe
+    # fills up while nobody is reading it.
+    threads = [
+        threading.Thread(target=feed, args=(procs[0].stdin, input)),
+        threading.Thread(target=collect, args=('out', procs[-1].stdout)),
+        threading.Thread(target=collect, args=('err', procs[-1].stderr)),
+    ]
     try:
-        # Send stdin and collect stdout.
-        procs[0].stdin.write(input)
-        procs[0].stdin.close()
-        return procs[-1].communicate(timeout=timeout)
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                raise subprocess.TimeoutExpired(cmds, timeout)
+
+        # Reap the commands ourselves, rather than letting `Popen` do it,
+        # to get their resource usage.
+        usage = []
+        for proc in procs:
+            while True:
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.monotonic() > deadline:
+                    raise subprocess.TimeoutExpired(cmds, timeout)
+                time.sleep(0.001)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            usage.append((rusage.ru_utime + rusage.ru_stime,
+                          rusage.ru_maxrss))
+        return outputs['out'], outputs['err'], usage
     finally:
         for proc in procs:
             proc.kill()
 
 
+def summarize(samples):
+    """Summarize a run's timing samples, which are pairs of wall-clock
+    seconds and `run_pipe` resource usage. Produce a map from each of
+    the `TIMING_COLUMNS` to its value: the mean, standard deviation, and
+    minimum of the wall-clock and CPU time, and the largest resident set
+    size of any command.
+    """
+    walls = [wall for wall, _ in samples]
+    cpus = [sum(cpu for cpu, _ in usage) for _, usage in samples]
+    out = []
+    for xs in walls, cpus:
+        out += [
+            statistics.mean(xs),
+            statistics.stdev(xs) if len(xs) > 1 else 0.0,
+            min(xs),
+        ]
+    out.append(max(rss for _, usage in samples for _, rss in usage))
+    return dict(zip(TIMING_COLUMNS, out))
+
+
+def summarize_stages(samples, cmds):
+    """Summarize the resource usage of each command in a pipeline across
+    a run's timing samples, as a list of maps with the command, its mean
+    CPU time, and its largest resident set size.
+    """
+    return [
+        {
+            'command': cmd,
+            'cpu_mean': statistics.mean(usage[i][0] for _, usage in samples),
+            'maxrss': max(usage[i][1] for _, usage in samples),
+        }
+        for i, cmd in enumerate(cmds)
+    ]
+
+
+def read_done(path, format):
+    """Find the (benchmark, run) pairs that already have results in an
+    output file from an earlier, possibly interrupted, invocation. Drop
+    any partial line at the end of the file, so we can append to it.
+    """
+    try:
+        with open(path) as f:
+            text = f.read()
+    except FileNotFoundError:
+        return set()
+    if not text.endswith('\n'):
+        text = text[:text.rfind('\n') + 1]
+        with open(path, 'w') as f:
+            f.write(text)
+
+    if format == 'csv':
+        rows = csv.DictReader(text.splitlines())
+    else:
+        rows = []
+        for line in text.splitlines():
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                pass
+    return {(row['benchmark'], row['run']) for row in rows}
+
+
+class RowWriter:
+    """Write result rows, given as maps, to a file as CSV (with the given
+    columns, optionally preceded by a header) or as JSON lines. Flush
+    after every row, so an interrupted run loses nothing it reported.
+    """
+    def __init__(self, file, format, columns, header=True):
+        self.file = file
+        self.format = format
+        if format == 'csv':
+            self.writer = csv.DictWriter(file, columns, restval='',
+                                         extrasaction='ignore')
+            if header:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self.writer.writerow({
+                k: '{:.6f}'.format(v) if isinstance(v, float) else v
+                for k, v in row.items()
+            })
+        else:
+            self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+
+
+@functools.lru_cache(maxsize=None)
+def file_digest(path, mtime, size):
+    """Hash the contents of a file. The modification time and size are
+    only there to invalidate the memoized result when the file changes.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dep_digests(cmds):
+    """Hash the files that a pipeline's shell commands name: the program
+    each command runs (looked up on the PATH) and any word that is the
+    path of an existing file, such as a script given to an interpreter.
+    """
+    digests = {}
+    for cmd in cmds:
+        try:
+            words = shlex.split(cmd)
+        except ValueError:
+            continue
+        for i, word in enumerate(words):
+            path = shutil.which(word) if i == 0 else None
+            if not path and os.path.isfile(word):
+                path = word
+            if path and path not in digests:
+                st = os.stat(path)
+                digests[path] = file_digest(os.path.realpath(path),
+                                            st.st_mtime_ns, st.st_size)
+    return digests
+
+
+class ResultCache:
+    """A directory of saved pipeline outputs.
+
+    Each entry is keyed by a hash of the benchmark's contents, the
+    pipeline's commands (with arguments filled in), and, if `deps` is
+    set, the contents of the files those commands name. With `refresh`,
+    ignore existing entries but still save new ones.
+    """
+    def __init__(self, path, refresh=False, deps=True):
+        self.path = path
+        self.refresh = refresh
+        self.deps = deps
+
+    def key(self, in_data, cmds):
+        deps = dep_digests(cmds) if self.deps else {}
+        blob = json.dumps([__version__, in_data, cmds, deps], sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, key):
+        """Get the saved result for a key, or None."""
+        if self.refresh:
+            return None
+        try:
+            with open(self._entry(key)) as f:
+                return tuple(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, result):
+        """Save the result for a key. Failing to save is not an error;
+        the run just is not cached.
+        """
+        entry = self._entry(key)
+
+        # Write to a temporary file and rename it into place, so
+        # concurrent runs never see a partial entry.
+        tmp = '{}.{}.{}.tmp'.format(entry, os.getpid(),
+                                    threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(list(result), f)
+            os.replace(tmp, entry)
+        except OSError:
+            pass
+
+
+def pinned_pool(cores):
+    """Make a thread pool with one worker for each of the given CPU
+    cores. Each worker pins itself to its own core, so every command it
+    starts runs there too.
+    """
+    free = queue.SimpleQueue()
+    for core in cores:
+        free.put(core)
+
+    def pin():
+        os.sched_setaffinity(0, {free.get()})
+
+    return futures.ThreadPoolExecutor(max_workers=len(cores),
+                                      initializer=pin)
+
+
+class Scheduler:
+    """The thread pools that run pipelines.
+
+    Without `pin`, this is a single pool of `jobs` threads. With `pin`,
+    every worker gets a dedicated core: `reserve` cores (if any) go to a
+    pool for exclusive work, and the rest, or at most `jobs` of them, to
+    a pool for everything else.
+    """
+    def __init__(self, jobs=None, pin=False, reserve=0):
+        if not pin:
+            self.pool = futures.ThreadPoolExecutor(max_workers=jobs)
+            self.reserved = self.pool
+            return
+
+        cores = sorted(os.sched_getaffinity(0))
+        if reserve >= len(cores):
+            raise click.UsageError(
+                'cannot reserve {} of {} cores'.format(reserve, len(cores))
+            )
+        shared = cores[reserve:]
+        if jobs:
+            shared = shared[:jobs]
+        self.pool = pinned_pool(shared)
+        self.reserved = pinned_pool(cores[:reserve]) if reserve \
+            else self.pool
+
+    def submit(self, exclusive, fn, *args):
+        """Schedule a call on the reserved cores if `exclusive` (and any
+        are reserved), or on the shared ones otherwise.
+        """
+        pool = self.reserved if exclusive else self.pool
+        return pool.submit(fn, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown()
+        self.reserved.shutdown()
+
+
+def load_durations(path):
+    """Load the time each benchmark took on its last run, as a map from
+    file names to seconds, from a JSON file (if there is one).
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_durations(path, durations):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(durations, f, indent=2, sort_keys=True)
+    except OSError:
+        pass
+
+
 def compare_output(o1, o2, ε=0.0):
     def my_compare(x, y):
         try:
@@ -55,8 +365,66 @@ def compare_output(o1, o2, ε=0.0):
     return all(my_compare(x, y) for x, y in zip(o1.split(), o2.split()))
 
 
-def run_bench(pipeline, fn, timeout):
-    """Run a single benchmark pipeline.
+def prefix_tree(pipelines):
+    """Merge pipelines, given as a map from run names to command lists,
+    into a tree where runs that begin with the same commands share a
+    path. Every node is a dict with `children`, a map from the next
+    command to a node, and `runs`, the runs whose pipelines end there.
+    """
+    root = {'children': {}, 'runs': []}
+    for name, cmds in pipelines.items():
+        node = root
+        for cmd in cmds:
+            node = node['children'].setdefault(cmd, {'children': {},
+                                                     'runs': []})
+        node['runs'].append(name)
+    return root
+
+
+def segments(node):
+    """Get the ways to continue from a node in a prefix tree, as pairs of
+    a list of commands and the node they lead to. Consecutive commands
+    are grouped until the tree branches or some run ends, so each group
+    can run as a single shell pipeline.
+    """
+    out = []
+    for cmd, child in node['children'].items():
+        cmds = [cmd]
+        while len(child['children']) == 1 and not child['runs']:
+            (cmd, child), = child['children'].items()
+            cmds.append(cmd)
+        out.append((cmds, child))
+    return out
+
+
+def tree_runs(node):
+    """Get the names of all the runs that end at or below a node."""
+    out = list(node['runs'])
+    for child in node['children'].values():
+        out += tree_runs(child)
+    return out
+
+
+def submit_bench(sched, pipelines, fn, timeout, cache=None, warmup=0,
+                 repeat=1, exclusive=(), log_time=None):
+    """Start all the runs of a single benchmark on a `Scheduler`, given
+    a map from run names to pipelines. Return two maps from run names:
+    one to the commands run, with the benchmark's arguments filled in,
+    and one to futures for their results. A result consists of the
+    stdout and stderr of the run's final command, and a list of `repeat`
+    timing samples, each a pair of the wall-clock seconds and the
+    `run_pipe` resource usage of the whole pipeline. Every command runs
+    `warmup` extra times before it is timed.
+
+    Runs whose pipelines begin with the same commands share the work:
+    each distinct prefix runs once, and its output feeds every pipeline
+    that continues from it. Each run still gets `timeout` seconds in all,
+    counting its share of the prefixes. Runs with an entry in the
+    `ResultCache`, if given, do not run at all.
+
+    Commands that any of the `exclusive` runs depend on go to the
+    scheduler's reserved cores. If `log_time` is given, call it with the
+    wall-clock seconds spent on every shared segment of commands.
     """
     # Load the benchmark.
     with open(fn) as f:
@@ -66,12 +434,69 @@ def run_bench(pipeline, fn, timeout):
     match = re.search(ARGS_RE, in_data)
     args = match.group(1) if match else ''
 
-    # Run pipeline.
-    cmds = [
-        c.format(args=args)
-        for c in pipeline
-    ]
-    return run_pipe(cmds, in_data, timeout)
+    commands = {}
+    futs = {}
+    keys = {}
+    todo = {}
+    for name, pipeline in pipelines.items():
+        futs[name] = futures.Future()
+        cmds = commands[name] = [c.format(args=args) for c in pipeline]
+        if cache is not None:
+            keys[name] = cache.key(in_data, cmds)
+            result = cache.get(keys[name])
+            if result is not None:
+                futs[name].set_result(result)
+                continue
+        todo[name] = cmds
+
+    def run_segment(cmds, node, input, budget, samples):
+        timed = []
+        begin = time.monotonic()
+        try:
+            for i in range(warmup + repeat):
+                if budget <= 0:
+                    raise subprocess.TimeoutExpired(cmds, timeout)
+                start = time.monotonic()
+                stdout, stderr, usage = run_pipe(cmds, input, budget)
+                if i >= warmup:
+                    timed.append((time.monotonic() - start, usage))
+        except Exception as exc:
+            for name in tree_runs(node):
+                futs[name].set_exception(exc)
+            return
+        finally:
+            if log_time:
+                log_time(time.monotonic() - begin)
+        budget -= max(wall for wall, _ in timed)
+
+        # Add this segment's time to the time of the prefix so far.
+        samples = [(w1 + w2, u1 + u2)
+                   for (w1, u1), (w2, u2) in zip(samples, timed)]
+        result = (stdout, stderr, samples)
+
+        # Start the pipelines that continue from here before finishing
+        # the ones that end here, so the pool is never idle while a
+        # caller still waits on one of them.
+        for next_cmds, child in segments(node):
+            sched.submit(is_exclusive(child), run_segment, next_cmds, child,
+                         stdout, budget, samples)
+        for name in node['runs']:
+            futs[name].set_result(result)
+            if cache is not None:
+                cache.put(keys[name], result)
+
+    def is_exclusive(node):
+        return any(name in exclusive for name in tree_runs(node))
+
+    tree = prefix_tree(todo)
+    for name in tree['runs']:
+        futs[name].set_exception(ValueError(
+            'run {} has an empty pipeline'.format(name)
+        ))
+    for cmds, node in segments(tree):
+        sched.submit(is_exclusive(node), run_segment, cmds, node, in_data,
+                     timeout, [(0.0, [])] * repeat)
+    return commands, futs
 
 
 def get_result(strings, extract_re):
@@ -87,10 +512,27 @@ def get_result(strings, extract_re):
 @click.command()
 @click.option('-j', '--jobs', default=None, type=int,
               help='parallel threads to use (default: suitable for machine)')
+@click.option('--no-cache', is_flag=True,
+              help='neither use nor save cached results')
+@click.option('--refresh', is_flag=True,
+              help='rerun everything, replacing cached results')
+@click.option('--pin', is_flag=True,
+              help='run each job on a dedicated CPU core')
+@click.option('--reserve', default=0, type=int,
+              help='with --pin, cores to set aside for exclusive runs')
+@click.option('--format', 'format', default='csv',
+              type=click.Choice(['csv', 'jsonl']),
+              help='output format (default: csv)')
+@click.option('-o', '--output', default=None, type=click.Path(),
+              help='file to write results to (default: standard output)')
+@click.option('--resume', is_flag=True,
+              help='skip results already in the output file, and append')
 @click.argument('config_path', metavar='CONFIG', type=click.Path(exists=True))
 @click.argument('files', nargs=-1, type=click.Path(exists=True))
-def brench(config_path, files, jobs):
-    """Run a batch of benchmarks and emit a CSV of results.
+def brench(config_path, files, jobs, no_cache, refresh, pin, reserve, format,
+           output, resume):
+    """Run a batch of benchmarks and emit a CSV (or JSON lines) of
+    results.
     """
     with open(config_path) as f:
         config = tomlkit.loads(f.read())
@@ -102,46 +544,131 @@ def brench(config_path, files, jobs):
     timeout = config.get('timeout', 5)
     ε = config.get('epsilon', 0.0)
 
-    with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
-        # Submit jobs.
+    # Report timing statistics if the configuration asks for them.
+    timing = 'repeat' in config or 'warmup' in config
+    repeat = config.get('repeat', 1)
+    warmup = config.get('warmup', 0)
+
+    cache_dir = config.get('cache', '.brench-cache')
+    # Saved timing numbers would be stale, so timed runs always execute.
+    if no_cache or timing:
+        cache = None
+    else:
+        cache = ResultCache(cache_dir, refresh,
+                            config.get('cache_deps', True))
+
+    # Find the results we still need.
+    if resume and not output:
+        raise click.UsageError('--resume needs an --output file')
+    done = read_done(output, format) if resume else set()
+    runs = list(config['runs'])
+    benches = {fn: os.path.splitext(os.path.basename(fn))[0] for fn in files}
+    todo = {fn: [name for name in runs if (benches[fn], name) not in done]
+            for fn in files}
+    files = [fn for fn in files if todo[fn]]
+
+    # Start the benchmarks that took longest last time first, so none of
+    # them is left running alone at the end. Those we have not seen
+    # before might be long, so they go first of all.
+    durations_path = os.path.join(cache_dir, 'durations.json')
+    durations = load_durations(durations_path)
+    order = sorted(files, key=lambda fn: -durations.get(fn, float('inf')))
+    spent = {fn: 0.0 for fn in files}
+    lock = threading.Lock()
+
+    def logger(fn):
+        def log_time(secs):
+            with lock:
+                spent[fn] += secs
+        return log_time
+
+    if output:
+        out_file = open(output, 'a' if resume else 'w')
+    else:
+        out_file = sys.stdout
+    columns = ['benchmark', 'run', 'result']
+    if timing:
+        columns += TIMING_COLUMNS
+    writer = RowWriter(out_file, format, columns,
+                       header=not (resume and os.path.getsize(output)))
+
+    def report(fn, name, outcome, first_out):
+        stdout, stderr, samples, status = outcome
+
+        # Check correctness.
+        if first_out is not None and not status and \
+           not compare_output(stdout, first_out, ε):
+            status = 'incorrect'
+
+        # Extract the figure of merit.
+        result = get_result([stdout, stderr], config['extract'])
+        if not result and not status:
+            status = 'missing'
+
+        # Report the result.
+        row = {
+            'benchmark': benches[fn],
+            'run': name,
+            'result': status if status else result,
+        }
+        if timing and samples:
+            row.update(summarize(samples))
+            if format == 'jsonl':
+                row['stages'] = summarize_stages(samples,
+                                                 commands[fn, name])
+        writer.write(row)
+
+    with Scheduler(jobs, pin, reserve) as sched:
+        # Submit jobs. The first run's output is the reference for the
+        # others, so it runs whenever any of them does.
+        exclusive = {name for name, run in config['runs'].items()
+                     if run.get('exclusive', False)}
+        commands = {}
         futs = {}
-        for fn in files:
-            for name, run in config['runs'].items():
-                futs[(fn, name)] = pool.submit(run_bench, run['pipeline'], fn,
-                                               timeout)
-
-        # Collect results and print CSV.
-        writer = csv.writer(sys.stdout)
-        writer.writerow(['benchmark', 'run', 'result'])
-        for fn in files:
-            first_out = None
-            for name in config['runs']:
-                try:
-                    stdout, stderr = futs[(fn, name)].result()
-                except subprocess.TimeoutExpired:
-                    stdout, stderr = '', ''
-                    status = 'timeout'
-                else:
-                    status = None
-
-                # Check correctness.
-                if first_out is None:
-                    first_out = stdout
-                elif not compare_output(stdout, first_out, ε) and not status:
-                    status = 'incorrect'
-
-                # Extract the figure of merit.
-                result = get_result([stdout, stderr], config['extract'])
-                if not result and not status:
-                    status = 'missing'
-
-                # Report the result.
-                bench, _ = os.path.splitext(os.path.basename(fn))
-                writer.writerow([
-                    bench,
-                    name,
-                    status if status else result,
-                ])
+        for fn in order:
+            pipelines = {name: config['runs'][name]['pipeline']
+                         for name in runs
+                         if name == runs[0] or name in todo[fn]}
+            bench_cmds, bench_futs = submit_bench(
+                sched, pipelines, fn, timeout, cache, warmup, repeat,
+                exclusive, logger(fn),
+            )
+            for name, fut in bench_futs.items():
+                commands[fn, name] = bench_cmds[name]
+                futs[fut] = (fn, name)
+
+        # Report each run as soon as it and its benchmark's first run are
+        # done.
+        first_outs = {}
+        waiting = collections.defaultdict(list)
+        for fut in futures.as_completed(futs):
+            fn, name = futs[fut]
+            try:
+                stdout, stderr, samples = fut.result()
+            except subprocess.TimeoutExpired:
+                outcome = ('', '', None, 'timeout')
+            else:
+                outcome = (stdout, stderr, samples, None)
+
+            if name == runs[0]:
+                first_outs[fn] = outcome[0]
+                if name in todo[fn]:
+                    report(fn, name, outcome, None)
+                for other in waiting.pop(fn, []):
+                    report(fn, *other, first_outs[fn])
+            elif fn in first_outs:
+                report(fn, name, outcome, first_outs[fn])
+            else:
+                waiting[fn].append((name, outcome))
+
+    if output:
+        out_file.close()
+
+    # Remember how long each benchmark took, unless it was all cached.
+    # With --no-cache, leave the cache directory alone.
+    if not no_cache:
+        durations.update({fn: secs for fn, secs in spent.items() if secs})
+        save_durations(durations_path, durations)
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@
 
 # Mark Moeller:
 
+import heapq
 import sys
 
 TERM = 'jmp', 'br', 'ret'
@@ -117,16 +118,30 @@ class CFG:
 
         colors = [WHITE] * self.n
 
-        def dfs_visit(node):
-            if colors[node] == WHITE:
-                colors[node] = GRAY
-                if pre:
-                    pre(node)
-                for v in edges[node]:
-                    dfs_visit(v)
-                colors[node] = BLACK
-                if post:
-                    post(node)
+        # Keep an explicit stack of (node, remaining successors) rather
+        # than recursing, so long chains of blocks don't overflow
+        # Python's stack.
+        def dfs_visit(root):
+            if colors[root] != WHITE:
+                return
+            colors[root] = GRAY
+            if pre:
+                pre(root)
+            stack = [(root, iter(edges[root]))]
+            while stack:
+                node, rest = stack[-1]
+                for v in rest:
+                    if colors[v] == WHITE:
+                        colors[v] = GRAY
+                        if pre:
+                            pre(v)
+                        stack.append((v, iter(edges[v])))
+                        break
+                else:
+                    stack.pop()
+                    colors[node] = BLACK
+                    if post:
+                        post(node)
 
         for i in order:
             dfs_visit(i)
@@ -261,26 +276,51 @@ def rd_merge(pred_list):
 # xfer: (in_b, block) -> out_b:         Compute transfer for a single block.
 # merge: List of out_b -> in_b:         Given a list of predecessors' out_b's,
 #                                       compute a single in_b.
+# stats: optional dict; the number of transfer evaluations is added to
+#        stats['transfers'].
+#
+# Blocks are visited in sweeps over reverse postorder: a block queued behind
+# the current position (along a back edge) waits for the next sweep, and no
+# block is ever queued twice.
 # ------------------------------------------------------------------------------
 
-def run_worklist(func, init, xfer, merge):
+def run_worklist(func, init, xfer, merge, stats=None):
     graph = CFG(func)
 
     (in_b, out_b) = init(func, graph)
 
-    worklist = list(range(graph.n))
+    order = [0] * graph.n
+    for i, b in enumerate(graph.rpo()):
+        order[b] = i
+
+    worklist = [(order[b], b) for b in range(graph.n)]
+    heapq.heapify(worklist)
+    next_sweep = []
+    queued = set(range(graph.n))
+    position = -1
+    transfers = 0
 
-    while worklist:
-        b = worklist[0]
-        worklist = worklist[1:]
+    while worklist or next_sweep:
+        if not worklist:
+            worklist, next_sweep = next_sweep, worklist
+        position, b = heapq.heappop(worklist)
+        queued.remove(b)
 
         in_b[b] = merge([out_b[x] for x in graph.preds[b]]) if graph.preds[b] else {}
 
         out_b_copy = out_b[b].copy()
 
         out_b[b] = xfer(in_b[b], graph.blocks[b], b)
+        transfers += 1
 
         if out_b[b] != out_b_copy:
-            worklist += graph.edges[b]
+            for s in graph.edges[b]:
+                if s not in queued:
+                    queued.add(s)
+                    heapq.heappush(worklist if order[s] > position
+                                   else next_sweep, (order[s], s))
+
+    if stats is not None:
+        stats['transfers'] = stats.get('transfers', 0) + transfers
 
     return (in_b, out_b)
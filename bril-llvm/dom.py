@@ -3,86 +3,89 @@
 import sys
 import json
 from brilpy import *
-from functools import reduce
 
 class Dominators:
 
     def __init__(self, func):
         g = CFG(func)
 
-        # First compute dominators
-        # IMPORTANT: This computes, for each block, the set of blocks that dominate
-        # it, not the other way around
-        self.doms = []
-        self.doms.append(set([0])) # Entry block is special, it's its own dominator
-        for i in range(1,g.n):
-            self.doms.append(set(range(g.n)))
-
-        order = g.rpo()
+        # Number the blocks reachable from the entry in reverse postorder.
+        post = []
+        g.dfs(order=[0], post=post.append)
+        order = list(reversed(post))
+        rpo_num = [None] * g.n
+        for i, b in enumerate(order):
+            rpo_num[b] = i
+
+        # Compute immediate dominators with the Cooper-Harvey-Kennedy
+        # algorithm: keep one idom per block and iterate over the RPO,
+        # intersecting the predecessors' (partial) dominator tree paths.
+        idom = [None] * g.n
+        idom[0] = 0
+
+        def intersect(b1, b2):
+            while b1 != b2:
+                while rpo_num[b1] > rpo_num[b2]:
+                    b1 = idom[b1]
+                while rpo_num[b2] > rpo_num[b1]:
+                    b2 = idom[b2]
+            return b1
 
         changed = True
         while changed:
             changed = False
-            for i in order[1:]: # no one can dominate 0 except 0
-                d = {i}
-                if g.preds[i]:
-                    d |= reduce(set.intersection, [self.doms[p] for p in g.preds[i]], set(range(g.n)))
-
-                if d != self.doms[i]:
+            for i in order[1:]:  # no one can dominate 0 except 0
+                new_idom = None
+                for p in g.preds[i]:
+                    if idom[p] is not None:
+                        new_idom = p if new_idom is None \
+                            else intersect(p, new_idom)
+                if new_idom != idom[i]:
                     changed = True
-                    self.doms[i] = d
+                    idom[i] = new_idom
+        idom[0] = None
 
-        # Compute the "other way around" (from above), that is, for each block, the
-        # set of blocks this block dominates
+        # IMPORTANT: This computes, for each block, the set of blocks that
+        # dominate it, not the other way around
+        self.doms = []
+        for i in range(g.n):
+            d = {i}
+            j = idom[i]
+            while j is not None:
+                d.add(j)
+                j = idom[j]
+            self.doms.append(d)
+
+        # Compute the "other way around" (from above), that is, for each
+        # block, the set of blocks this block dominates
         self.dom_by = []
         for i in range(g.n):
             self.dom_by.append(set())
 
-        for i,d in enumerate(self.doms):
+        for i, d in enumerate(self.doms):
             for mbr in d:
                 self.dom_by[mbr].add(i)
 
+        # The dominance tree maps each block to the blocks it immediately
+        # dominates (and None to the entry block)
+        self.dom_tree = {None: [0]}
+        for i in order[1:]:
+            self.dom_tree.setdefault(idom[i], []).append(i)
 
-
-        # Compute the dominance tree
-        dt_parent = [None]
-
-        for i in range(1, g.n):
-            for j in self.doms[i]:
-                if i != j:  # j strictly dominates i
-                    immed_dom = True
-                    for k in range(g.n):
-                        if k != j and k != i and j in self.doms[k] and k in self.doms[i]:
-                            immed_dom = False
-                            break
-                    if immed_dom:
-                        dt_parent.append(j)
-                        break
-
-        self.dom_tree = {}
-        for i,p in enumerate(dt_parent):
-            if p in self.dom_tree:
-                self.dom_tree[p].append(i)
-            else:
-                self.dom_tree[p] = [i]
-
-        # Compute dominance frontier
+        # Compute dominance frontier: walk up the dominance tree from each
+        # predecessor until reaching the block's immediate dominator
         self.frontier = []
         for i in range(g.n):
             self.frontier.append(set())
 
-        for i,d in enumerate(self.doms):
-            # Union of dominators for this node's preds
-            pre_doms = reduce(set.union, [self.doms[p] for p in g.preds[i]], set())
-            # Subtract out strict dominators for this node
-            pre_doms = pre_doms.difference(self.doms[i].difference(set([i])))
-
-            # This node is in the frontier for the remaining nodes:
-            for p in pre_doms:
-                self.frontier[p].add(i)
-
-
-
+        for i in order:
+            for p in g.preds[i]:
+                if rpo_num[p] is None:
+                    continue  # unreachable predecessor
+                runner = p
+                while runner is not None and runner != idom[i]:
+                    self.frontier[runner].add(i)
+                    runner = idom[runner]
 
 
 def main():
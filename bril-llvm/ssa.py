@@ -156,16 +156,25 @@ def to_ssa(prog):
                         phis[s][v]['args'].append(stack[v][-1])
                         phis[s][v]['labels'].append(g.names[b])
 
-            if b in domins.dom_tree:
-                for b_dom in domins.dom_tree[b]:
-                    rename(b_dom)
-
-            # pop all the names
-            for var,count in push_count.items():
-                for j in range(count):
-                    stack[var].pop()
+            return push_count
+
+        # Walk the dominator tree with an explicit stack (rather than
+        # recursing, which overflows on long chains of blocks). Entries
+        # are blocks to rename or, to leave a subtree, the push counts of
+        # its root.
+        work = [0]
+        while work:
+            item = work.pop()
+            if isinstance(item, dict):
+                # pop all the names
+                for var,count in item.items():
+                    for j in range(count):
+                        stack[var].pop()
+                continue
 
-        rename(0)
+            work.append(rename(item))
+            if item in domins.dom_tree:
+                work.extend(reversed(domins.dom_tree[item]))
 
 
         # Add labels to blocks missing labels, and add jumps to blocks that fall
@@ -5,14 +5,45 @@ human-editable representation of Bril programs. There are two commands:
 `bril2txt`, which takes a Bril program in its (canonical) JSON format and
 pretty-prints it in the text format, and `bril2json`, which parses the
 format and emits the ordinary JSON representation.
+
+Both commands normally filter standard input to standard output. Given
+a list of files (or a manifest listing them), they instead convert the
+whole batch in a single process.
 """
 
-import lark
-import sys
+import argparse
+import concurrent.futures
+import functools
+import io
 import json
+import os
+import sys
+
+import lark
 
 __version__ = '0.0.1'
 
+# Set this environment variable to exchange compact (unindented,
+# unsorted) JSON between tools instead of the human-readable format.
+COMPACT_VAR = 'BRIL_COMPACT_JSON'
+
+
+# JSON encoding and decoding.
+
+def compact_json():
+    """Check whether the compact wire format is requested."""
+    return os.environ.get(COMPACT_VAR, '') not in ('', '0')
+
+
+def dumps(data):
+    """Encode a Bril program as a JSON string.
+
+    The output is pretty-printed unless compact mode is on.
+    """
+    if not compact_json():
+        return json.dumps(data, indent=2, sort_keys=True)
+    return json.dumps(data, separators=(',', ':'), check_circular=False)
+
 
 # Text format parser.
 
@@ -22,15 +53,15 @@ start: (struct | func)*
 struct: STRUCT IDENT "=" "{" mbr* "}"
 mbr: IDENT ":" type ";"
 
-func: FUNC ["(" arg_list? ")"] [tyann] "{" instr* "}"
-arg_list: | arg ("," arg)*
+func: FUNC ["(" [arg_list] ")"] [tyann] "{" instr* "}"
+arg_list: arg ("," arg)*
 arg: IDENT ":" type
 ?instr: const | vop | eop | label
 
-const.4: IDENT [tyann] "=" "const" lit ";"
-vop.3: IDENT [tyann] "=" op ";"
-eop.2: op ";"
-label.1: LABEL ":"
+const: IDENT [tyann] "=" "const" lit ";"
+vop: IDENT [tyann] "=" op ";"
+eop: op ";"
+label: LABEL ":"
 
 op: IDENT (FUNC | LABEL | IDENT)*
 
@@ -211,15 +242,41 @@ class JSONTransformer(lark.Transformer):
         return 0
 
 
+# The compiled parser, shared by every call in this process.
+_parser = None
+
+
+def get_parser():
+    """Get the (memoized) LALR parser for the text format.
+
+    Compiling the grammar's tables is far more expensive than parsing a
+    typical program, so we do it at most once per process. Lark also
+    keeps the serialized tables in an on-disk cache (keyed by a hash of
+    the grammar and the parser options), so later processes can skip
+    the compilation step entirely.
+    """
+    global _parser
+    if _parser is None:
+        _parser = lark.Lark(GRAMMAR, parser='lalr', maybe_placeholders=True,
+                            cache=True)
+    return _parser
+
+
+def parse_program(txt, include_pos=False):
+    """Parse a Bril program and return its JSON data structure.
+
+    Optionally include source position information.
+    """
+    tree = get_parser().parse(txt)
+    return JSONTransformer(include_pos).transform(tree)
+
+
 def parse_bril(txt, include_pos=False):
     """Parse a Bril program and return a JSON string.
 
     Optionally include source position information.
     """
-    parser = lark.Lark(GRAMMAR, maybe_placeholders=True)
-    tree = parser.parse(txt)
-    data = JSONTransformer(include_pos).transform(tree)
-    return json.dumps(data, indent=2, sort_keys=True)
+    return dumps(parse_program(txt, include_pos))
 
 
 # Text format pretty-printer.
@@ -266,12 +323,12 @@ def instr_to_string(instr):
             return rhs
 
 
-def print_instr(instr):
-    print('  {};'.format(instr_to_string(instr)))
+def print_instr(instr, file=None):
+    print('  {};'.format(instr_to_string(instr)), file=file)
 
 
-def print_label(label):
-    print('.{}:'.format(label['label']))
+def print_label(label, file=None):
+    print('.{}:'.format(label['label']), file=file)
 
 
 def args_to_string(args):
@@ -284,31 +341,170 @@ def args_to_string(args):
         return ''
 
 
-def print_func(func):
+def print_func(func, file=None):
     typ = func.get('type', 'void')
     print('@{}{}{} {{'.format(
         func['name'],
         args_to_string(func.get('args', [])),
         ': {}'.format(type_to_str(typ)) if typ != 'void' else '',
-    ))
+    ), file=file)
     for instr_or_label in func['instrs']:
         if 'label' in instr_or_label:
-            print_label(instr_or_label)
+            print_label(instr_or_label, file)
         else:
-            print_instr(instr_or_label)
-    print('}')
+            print_instr(instr_or_label, file)
+    print('}', file=file)
 
 
-def print_prog(prog):
+def print_prog(prog, file=None):
     for func in prog['functions']:
-        print_func(func)
+        print_func(func, file)
+
+
+def prog_to_string(prog):
+    out = io.StringIO()
+    print_prog(prog, out)
+    return out.getvalue()
+
+
+# Batch conversion.
+
+def _to_json(path, include_pos):
+    """Convert one text-format file. Return the JSON data and an error
+    message (one of which is None).
+    """
+    try:
+        with open(path) as f:
+            return parse_program(f.read(), include_pos), None
+    except (OSError, ValueError, lark.exceptions.LarkError) as exc:
+        return None, str(exc)
+
+
+def _to_txt(path):
+    """Convert one JSON file. Return the text and an error message (one
+    of which is None).
+    """
+    try:
+        with open(path) as f:
+            return prog_to_string(json.load(f)), None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+        return None, str(exc)
+
+
+def _read_manifest(manifest):
+    """Get the list of paths in a newline-delimited manifest file, or
+    standard input for `-`.
+    """
+    if manifest == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(manifest) as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def _out_path(path, ext):
+    out = os.path.splitext(path)[0] + ext
+    if out == path:
+        raise ValueError('output would overwrite input: {}'.format(path))
+    return out
+
+
+def _write_out(path, ext, value):
+    """Write a converted file next to its input. Return an error message,
+    or None on success.
+    """
+    text = value if isinstance(value, str) else dumps(value) + '\n'
+    try:
+        with open(_out_path(path, ext), 'w') as f:
+            f.write(text)
+    except (OSError, ValueError) as exc:
+        return str(exc)
+    return None
+
+
+def convert_batch(convert, paths, jsonl, ext, jobs=1):
+    """Convert many files in this process (or a pool of `jobs` worker
+    processes), amortizing interpreter startup and parser construction.
+
+    `convert` takes a path and returns a pair: the converted value and
+    an error message. In `jsonl` mode, write one JSON object per input to
+    standard output; otherwise, write each output next to its input,
+    replacing the extension with `ext`. Return the number of failures.
+    """
+    if jobs > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(convert, paths, chunksize=8)
+    else:
+        pool = None
+        results = map(convert, paths)
+
+    failures = 0
+    try:
+        for path, (value, error) in zip(paths, results):
+            if error is None and not jsonl:
+                error = _write_out(path, ext, value)
+            if error is not None:
+                print('{}: {}'.format(path, error), file=sys.stderr)
+                failures += 1
+            elif jsonl:
+                key = 'text' if isinstance(value, str) else 'program'
+                print(json.dumps({'path': path, key: value}, sort_keys=True))
+    finally:
+        if pool:
+            pool.shutdown()
+    return failures
+
+
+def _arg_parser(description, ext):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='inputs to convert in batch mode')
+    parser.add_argument('-m', '--manifest', metavar='PATH',
+                        help='read input paths, one per line, from a file '
+                        '(or - for standard input)')
+    parser.add_argument('-l', '--jsonl', action='store_true',
+                        help='write a JSON-lines stream to standard output '
+                        'instead of files next to the inputs')
+    parser.add_argument('-e', '--ext', default=ext,
+                        help='extension for output files '
+                        '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes for batch mode')
+    return parser
+
+
+def _batch_paths(args):
+    paths = list(args.files)
+    if args.manifest:
+        paths += _read_manifest(args.manifest)
+    return paths
 
 
 # Command-line entry points.
 
 def bril2json():
-    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:]))
+    parser = _arg_parser('Convert Bril text to JSON.', '.json')
+    parser.add_argument('-p', '--positions', action='store_true',
+                        help='include source positions')
+    args = parser.parse_args()
+    paths = _batch_paths(args)
+    if not paths:
+        print(parse_bril(sys.stdin.read(), args.positions))
+        return
+
+    convert = functools.partial(_to_json, include_pos=args.positions)
+    if convert_batch(convert, paths, args.jsonl, args.ext, args.jobs):
+        sys.exit(1)
 
 
 def bril2txt():
-    print_prog(json.load(sys.stdin))
+    parser = _arg_parser('Convert Bril JSON to text.', '.bril')
+    args = parser.parse_args()
+    paths = _batch_paths(args)
+    if not paths:
+        print_prog(json.load(sys.stdin))
+        return
+
+    if convert_batch(_to_txt, paths, args.jsonl, args.ext, args.jobs):
+        sys.exit(1)
@@ -0,0 +1,155 @@
+"""Aggressive dead code elimination for Bril programs in SSA form.
+
+Trivial DCE (`tdce.py`) assumes every instruction is live until it finds
+that nothing uses its result, so it never deletes a branch or a loop.
+This pass works the other way around (Cytron et al.): it assumes every
+instruction is dead until proven live, marking only instructions with
+side effects at first and then everything they depend on, through both
+data (the definitions of their arguments) and control (the branches that
+decide whether they execute). Everything left unmarked is deleted, and
+unmarked branches become jumps, so computations that only feed dead
+branches or dead loops disappear along with them:
+
+    bril2json < prog.bril | python to_ssa.py | python adce.py
+
+Like any ADCE, the pass may delete a loop that computes nothing visible,
+even if that loop would never terminate.
+"""
+
+from cfg import CFG, reassemble
+from dom import get_idoms, idom_fronts
+from util import load_json, dump_json
+
+
+def critical(instr):
+    """Check whether an instruction is live regardless of its uses: it
+    has a side effect (or is a call, which may have one), or it returns.
+    """
+    op = instr['op']
+    if op in ('br', 'jmp', 'phi'):
+        return False
+    if 'dest' in instr:
+        return op == 'call'
+    return True
+
+
+def post_dominators(cfg):
+    """Compute the immediate post-dominators and the control dependences
+    of every block in a CFG.
+
+    We find dominators on the reverse graph, where a virtual exit node
+    (numbered `len(cfg)`) is the predecessor of every returning block.
+    Produce the immediate post-dominator of each block (the exit, or None
+    for blocks that never reach it) and, for each block, the set of
+    blocks whose branches decide whether it executes: its post-dominance
+    frontier.
+    """
+    exit_ = len(cfg)
+    exits = [i for i, ss in enumerate(cfg.succs) if not ss]
+    rsuccs = [list(ps) for ps in cfg.preds] + [exits]
+    rpreds = [list(ss) for ss in cfg.succs] + [[]]
+    for i in exits:
+        rpreds[i].append(exit_)
+
+    ipdom = get_idoms(rsuccs, rpreds, exit_)
+    deps = idom_fronts(ipdom, rpreds, exit_)
+    return ipdom[:exit_], deps[:exit_]
+
+
+def adce_func(func, cfg=None):
+    """Delete dead instructions, branches, and loops in an SSA function,
+    optionally reusing a `CFG` that was already built for it. The pass
+    changes control flow, so the CFG is stale afterward.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    blocks = list(cfg.blocks(func).values())
+    ipdom, deps = post_dominators(cfg)
+
+    # Where each variable is defined, as (block id, index) pairs.
+    defs = {}
+    for b, block in enumerate(blocks):
+        for i, instr in enumerate(block):
+            if 'dest' in instr:
+                defs[instr['dest']] = (b, i)
+
+    # Mark. Blocks that can never reach the exit (infinite loops) keep
+    # their terminators, so we never have to find a new target for them.
+    work = []
+    for b, block in enumerate(blocks):
+        for i, instr in enumerate(block):
+            if critical(instr):
+                work.append((b, i))
+        if ipdom[b] is None and cfg.succs[b]:
+            work.append((b, len(block) - 1))
+
+    live = set()
+    live_blocks = set()
+    while work:
+        b, i = work.pop()
+        if (b, i) in live:
+            continue
+        live.add((b, i))
+        instr = blocks[b][i]
+
+        # Data dependences: the definitions of the arguments.
+        for arg in instr.get('args', ()):
+            if arg in defs:
+                work.append(defs[arg])
+
+        # Control dependences: the branches that decide whether this
+        # block executes and, for a phi-node, the edges it comes from.
+        if b not in live_blocks:
+            live_blocks.add(b)
+            work += [(c, len(blocks[c]) - 1) for c in deps[b]]
+        if instr['op'] == 'phi':
+            for label in instr['labels']:
+                c = cfg.ids[label]
+                work.append((c, len(blocks[c]) - 1))
+
+    # Sweep. An unmarked branch decides nothing that matters, so it can
+    # jump straight to its nearest post-dominator that does something.
+    for b, block in enumerate(blocks):
+        term = block[-1]
+        new = [instr for i, instr in enumerate(block[:-1]) if (b, i) in live]
+        if term['op'] == 'br' and (b, len(block) - 1) not in live:
+            target = ipdom[b]
+            while target not in live_blocks:
+                target = ipdom[target]
+            term = {'op': 'jmp', 'labels': [cfg.names[target]]}
+        new.append(term)
+        blocks[b] = new
+
+    # Drop the blocks that are no longer reachable, and the phi-node
+    # arguments along the edges that went with them.
+    reachable = {cfg.entry}
+    stack = [cfg.entry]
+    while stack:
+        b = stack.pop()
+        for label in blocks[b][-1].get('labels', ()):
+            s = cfg.ids[label]
+            if s not in reachable:
+                reachable.add(s)
+                stack.append(s)
+
+    kept = {cfg.names[b]: blocks[b] for b in sorted(reachable)}
+    for block in kept.values():
+        for instr in block:
+            if instr['op'] == 'phi':
+                pairs = [(label, arg) for label, arg
+                         in zip(instr['labels'], instr['args'])
+                         if label in kept]
+                instr['labels'] = [p[0] for p in pairs]
+                instr['args'] = [p[1] for p in pairs]
+
+    func['instrs'] = reassemble(kept)
+
+
+def adce(bril):
+    for func in bril['functions']:
+        adce_func(func)
+    return bril
+
+
+if __name__ == '__main__':
+    dump_json(adce(load_json()))
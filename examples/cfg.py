@@ -1,6 +1,7 @@
 from collections import OrderedDict
 from util import fresh, flatten
-from form_blocks import TERMINATORS
+from form_blocks import TERMINATORS, form_blocks
+from traversal import reverse_postorder
 
 
 def block_map(blocks):
@@ -49,20 +50,21 @@ def add_terminators(blocks):
     """Given an ordered block map, modify the blocks to add terminators
     to all blocks (avoiding "fall-through" control flow transfers).
     """
+    names = list(blocks.keys())
     for i, block in enumerate(blocks.values()):
         if not block:
             if i == len(blocks) - 1:
                 # In the last block, return.
                 block.append({'op': 'ret', 'args': []})
             else:
-                dest = list(blocks.keys())[i + 1]
+                dest = names[i + 1]
                 block.append({'op': 'jmp', 'labels': [dest]})
         elif block[-1]['op'] not in TERMINATORS:
             if i == len(blocks) - 1:
                 block.append({'op': 'ret', 'args': []})
             else:
                 # Otherwise, jump to the next block.
-                dest = list(blocks.keys())[i + 1]
+                dest = names[i + 1]
                 block.append({'op': 'jmp', 'labels': [dest]})
 
 
@@ -75,9 +77,11 @@ def add_entry(blocks):
     """
     first_lbl = next(iter(blocks.keys()))
 
-    # Check for any references to the label.
+    # Check for any references to the label. (Phi-nodes name their
+    # predecessors, but they do not jump to them.)
     for instr in flatten(blocks.values()):
-        if 'labels' in instr and first_lbl in instr['labels']:
+        if 'labels' in instr and instr['op'] != 'phi' and \
+           first_lbl in instr['labels']:
             break
     else:
         return
@@ -104,10 +108,179 @@ def edges(blocks):
 
 def reassemble(blocks):
     """Flatten a CFG into an instruction list."""
-    # This could optimize slightly by opportunistically eliminating
-    # `jmp .next` and `ret` terminators where it is allowed.
+    # See `drop_fallthroughs` to remove the terminators that
+    # normalization added.
     instrs = []
     for name, block in blocks.items():
         instrs.append({'label': name})
         instrs += block
     return instrs
+
+
+def drop_fallthroughs(func):
+    """Remove the terminators that control could just as well fall
+    through: jumps to the very next label and, in a function with no
+    return value, a `ret` at the end. The function is no longer
+    normalized afterward.
+    """
+    instrs = func['instrs']
+    kept = []
+    for i, instr in enumerate(instrs):
+        if instr.get('op') == 'jmp' and i + 1 < len(instrs) and \
+           instrs[i + 1].get('label') == instr['labels'][0]:
+            continue
+        kept.append(instr)
+    if 'type' not in func and kept and kept[-1].get('op') == 'ret':
+        kept.pop()
+    func['instrs'] = kept
+
+
+class CFG:
+    """The control-flow graph of a single function.
+
+    Building a CFG normalizes the function in place: every block gets a
+    label and an explicit terminator, and the entry block has no
+    predecessors (see `add_entry` and `add_terminators`). Blocks get
+    dense integer ids in program order; `preds` and `succs` are lists
+    of id lists. The reverse postorder and dominator tree are computed
+    on first use and then kept.
+
+    A pass that does not change control flow (it never adds, removes, or
+    retargets labels and terminators) keeps the function normalized, so
+    later passes can keep using the same CFG instead of rebuilding it.
+    """
+
+    def __init__(self, func):
+        blocks = block_map(form_blocks(func['instrs']))
+        if not blocks:
+            blocks[fresh('b', blocks)] = []
+        add_entry(blocks)
+        add_terminators(blocks)
+        func['instrs'] = reassemble(blocks)
+
+        self.names = list(blocks.keys())
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.succs = [[self.ids[s] for s in successors(block[-1])]
+                      for block in blocks.values()]
+        self.preds = [[] for _ in self.names]
+        for i, ss in enumerate(self.succs):
+            for s in ss:
+                self.preds[s].append(i)
+        self.entry = 0
+
+        # The last block map we built or split, and the instruction list
+        # it came from, to avoid re-splitting an unchanged function.
+        self._blocks = blocks
+        self._instrs = func['instrs']
+
+        self._rpo = None
+        self._idom = None
+        self._dom_intervals = None
+        self._dom = None
+        self._dom_tree = None
+        self._dom_fronts = None
+        self._dj = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def blocks(self, func):
+        """Get a block map for the (normalized) function.
+
+        Raise a ValueError if the function's blocks no longer match the
+        graph, i.e., some pass changed control flow without discarding
+        this CFG.
+        """
+        if func['instrs'] is not self._instrs:
+            blocks = block_map(form_blocks(func['instrs']))
+            if list(blocks.keys()) != self.names:
+                raise ValueError('stale CFG for @{}'.format(func['name']))
+            self._blocks = blocks
+            self._instrs = func['instrs']
+        return self._blocks
+
+    def succ_map(self):
+        """Get the successor edges as a map between block names."""
+        return {name: [self.names[s] for s in self.succs[i]]
+                for i, name in enumerate(self.names)}
+
+    def pred_map(self):
+        """Get the predecessor edges as a map between block names."""
+        return {name: [self.names[p] for p in self.preds[i]]
+                for i, name in enumerate(self.names)}
+
+    @property
+    def rpo(self):
+        """The ids of the reachable blocks in reverse postorder."""
+        if self._rpo is None:
+            self._rpo = reverse_postorder(self.succs, self.entry)
+        return self._rpo
+
+    @property
+    def idom(self):
+        """The immediate dominator id of every block (None for the entry
+        and for unreachable blocks).
+        """
+        if self._idom is None:
+            from dom import get_idoms  # Avoid a circular import.
+            self._idom = get_idoms(self.succs, self.preds, self.entry)
+        return self._idom
+
+    def dominates(self, a, b):
+        """Check whether block id `a` dominates block id `b`."""
+        from dom import idom_tree, dom_intervals, dominates
+        if self._dom_intervals is None:
+            self._dom_intervals = dom_intervals(idom_tree(self.idom),
+                                                self.entry)
+        return dominates(self._dom_intervals, a, b)
+
+    @property
+    def dom(self):
+        """The dominance relation, as a map from each block name to the
+        names of the blocks that dominate it.
+        """
+        if self._dom is None:
+            from dom import idom_doms
+            self._dom = self._by_name(idom_doms(self.idom, self.entry))
+        return self._dom
+
+    @property
+    def dom_tree(self):
+        """The dominator tree, as a map from each block name to the
+        names of the blocks it immediately dominates.
+        """
+        if self._dom_tree is None:
+            from dom import idom_tree
+            self._dom_tree = self._by_name(idom_tree(self.idom))
+        return self._dom_tree
+
+    @property
+    def dom_fronts(self):
+        """The dominance frontier of every block, by name."""
+        if self._dom_fronts is None:
+            from dom import idom_fronts
+            self._dom_fronts = self._by_name(
+                idom_fronts(self.idom, self.preds, self.entry)
+            )
+        return self._dom_fronts
+
+    @property
+    def dj_graph(self):
+        """The arguments after the nodes for `dom.iterated_fronts`,
+        which finds iterated dominance frontiers by id: the successors,
+        immediate dominators, dominator tree, `dom_levels`, and
+        `join_levels`.
+        """
+        if self._dj is None:
+            from dom import idom_tree, dom_levels, join_levels
+            tree = idom_tree(self.idom)
+            levels = dom_levels(tree, self.entry)
+            reach = join_levels(tree, self.succs, self.idom, levels,
+                                self.entry)
+            self._dj = (self.succs, self.idom, tree, levels, reach)
+        return self._dj
+
+    def _by_name(self, id_sets):
+        """Convert a list of id collections to a map between names."""
+        return {self.names[i]: [self.names[j] for j in ids]
+                for i, ids in enumerate(id_sets)}
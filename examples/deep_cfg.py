@@ -0,0 +1,74 @@
+"""Generate Bril programs with very deep control flow, for checking that
+the tools do not recurse once per block (or per dominator-tree level).
+
+    python deep_cfg.py SHAPE SIZE | python passes.py to_ssa from_ssa | \\
+        python interp.py -p
+
+The SHAPE is one of:
+
+- chain: A straight line of SIZE blocks, each of which adds one to a
+  counter and falls through to the next. The dominator tree is a path.
+- nested: A row of loop nests, each `NEST_DEPTH` repeat-until loops
+  deep, for SIZE blocks in all. A nest is a row of loop headers that
+  each add one to the counter, then their latches from the innermost
+  out. Every loop runs once, and the counter needs a phi-node in every
+  header. The dominator tree is again a single path.
+
+Either way, the program prints the counter at the end. The output is
+Bril's JSON form.
+"""
+
+import sys
+
+from util import dump_json
+
+# How deeply the loops in the "nested" shape nest.
+NEST_DEPTH = 10
+
+
+def chain(size):
+    instrs = [{'label': 'entry'},
+              {'op': 'const', 'dest': 'x', 'type': 'int', 'value': 0},
+              {'op': 'const', 'dest': 'one', 'type': 'int', 'value': 1}]
+    for i in range(size):
+        instrs.append({'label': 'b{}'.format(i)})
+        instrs.append({'op': 'add', 'dest': 'x', 'type': 'int',
+                       'args': ['x', 'one']})
+    return instrs
+
+
+def nested(size, depth=NEST_DEPTH):
+    instrs = [{'label': 'entry'},
+              {'op': 'const', 'dest': 'x', 'type': 'int', 'value': 0},
+              {'op': 'const', 'dest': 'one', 'type': 'int', 'value': 1},
+              {'op': 'const', 'dest': 'again', 'type': 'bool',
+               'value': False}]
+    for n in range(max(1, size // (2 * depth))):
+        for i in range(depth):
+            instrs.append({'label': 'h{}.{}'.format(n, i)})
+            instrs.append({'op': 'add', 'dest': 'x', 'type': 'int',
+                           'args': ['x', 'one']})
+        for i in reversed(range(depth)):
+            out = 'l{}.{}'.format(n, i - 1) if i else 'n{}'.format(n)
+            instrs.append({'label': 'l{}.{}'.format(n, i)})
+            instrs.append({'op': 'br', 'args': ['again'],
+                           'labels': ['h{}.{}'.format(n, i), out]})
+        instrs.append({'label': 'n{}'.format(n)})
+    return instrs
+
+
+SHAPES = {
+    'chain': chain,
+    'nested': nested,
+}
+
+
+def deep_cfg(shape, size):
+    """Generate a program with a `main` function of the given shape."""
+    instrs = SHAPES[shape](size)
+    instrs.append({'op': 'print', 'args': ['x']})
+    return {'functions': [{'name': 'main', 'instrs': instrs}]}
+
+
+if __name__ == '__main__':
+    dump_json(deep_cfg(sys.argv[1], int(sys.argv[2])))
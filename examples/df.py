@@ -1,6 +1,7 @@
 import sys
 import json
-from collections import namedtuple
+import heapq
+from collections import namedtuple, defaultdict
 
 from form_blocks import form_blocks
 import cfg
@@ -12,6 +13,15 @@ import cfg
 # - transfer: The transfer function.
 Analysis = namedtuple('Analysis', ['forward', 'init', 'merge', 'transfer'])
 
+# A gen/kill analysis over a finite set of facts, which we can solve
+# with bit vectors instead of sets:
+# - forward: True for forward, False for backward.
+# - may: True to merge with union, False to merge with intersection.
+# - gen_kill: Take a block map and produce the list of all facts and two
+#   maps from block names to the sets of facts each block generates and
+#   kills. The transfer function is `gen | (in - kill)`.
+GenKill = namedtuple('GenKill', ['forward', 'may', 'gen_kill'])
+
 
 def union(sets):
     out = set()
@@ -20,9 +30,87 @@ def union(sets):
     return out
 
 
-def df_worklist(blocks, analysis):
+def postorder(blocks, succs):
+    """Get the names of all blocks in postorder of a depth-first search
+    from the entry. Unreachable blocks come first, in program order, so
+    that they precede everything else in postorder and follow everything
+    else in reverse postorder.
+    """
+    # Successors are visited last-first, so that in reverse postorder the
+    # first successor of a branch (usually a loop body) precedes the rest
+    # (usually the loop exit).
+    names = list(blocks.keys())
+    order = []
+    seen = {names[0]}
+    stack = [(names[0], reversed(succs[names[0]]))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child not in seen:
+                seen.add(child)
+                stack.append((child, reversed(succs[child])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    return [n for n in names if n not in seen] + order
+
+
+class Worklist:
+    """A set of pending blocks, visited in sweeps in priority order.
+
+    A block pushed behind the current position of the sweep (e.g., along
+    a loop back edge) waits for the next sweep instead of jumping the
+    queue, so each sweep visits every pending block at most once and
+    information flows around a whole loop before its header is revisited.
+    """
+    def __init__(self, nodes, priority):
+        self.priority = priority
+        self.current = [(priority[n], n) for n in nodes]
+        heapq.heapify(self.current)
+        self.next = []
+        self.pending = set(nodes)
+        self.position = -1
+        self.sweeps = 1
+
+    def __bool__(self):
+        return bool(self.current or self.next)
+
+    def push(self, node):
+        if node not in self.pending:
+            self.pending.add(node)
+            key = self.priority[node]
+            heap = self.current if key > self.position else self.next
+            heapq.heappush(heap, (key, node))
+
+    def pop(self):
+        if not self.current:
+            self.current, self.next = self.next, self.current
+            self.sweeps += 1
+        self.position, node = heapq.heappop(self.current)
+        self.pending.remove(node)
+        return node
+
+
+def worklist_order(blocks, succs, forward):
+    """Give each block its priority in the worklist: its position in
+    reverse postorder for forward analyses, or in postorder for backward
+    ones, so every block tends to be visited after its inputs.
+    """
+    order = postorder(blocks, succs)
+    if forward:
+        order.reverse()
+    return {name: i for i, name in enumerate(order)}
+
+
+def df_worklist(blocks, analysis, stats=None):
     """The worklist algorithm for iterating a data flow analysis to a
     fixed point.
+
+    Blocks are visited in sweeps over reverse postorder (postorder for
+    backward analyses). If `stats` is a dict, add the number of transfer
+    function evaluations and sweeps to its `transfers` and `sweeps`
+    entries.
     """
     preds, succs = cfg.edges(blocks)
 
@@ -41,18 +129,26 @@ def df_worklist(blocks, analysis):
     out = {node: analysis.init for node in blocks}
 
     # Iterate.
-    worklist = list(blocks.keys())
+    worklist = Worklist(blocks, worklist_order(blocks, succs,
+                                               analysis.forward))
+    transfers = 0
     while worklist:
-        node = worklist.pop(0)
+        node = worklist.pop()
 
         inval = analysis.merge(out[n] for n in in_edges[node])
         in_[node] = inval
 
         outval = analysis.transfer(blocks[node], inval)
+        transfers += 1
 
         if outval != out[node]:
             out[node] = outval
-            worklist += out_edges[node]
+            for n in out_edges[node]:
+                worklist.push(n)
+
+    if stats is not None:
+        stats['transfers'] = stats.get('transfers', 0) + transfers
+        stats['sweeps'] = stats.get('sweeps', 0) + worklist.sweeps
 
     if analysis.forward:
         return in_, out
@@ -60,6 +156,94 @@ def df_worklist(blocks, analysis):
         return out, in_
 
 
+def to_bits(facts, index):
+    """Encode a collection of facts as an integer bit set, given a map
+    from facts to bit positions.
+    """
+    bits = 0
+    for f in facts:
+        bits |= 1 << index[f]
+    return bits
+
+
+def from_bits(bits, facts):
+    """Decode an integer bit set into a set of facts."""
+    out = set()
+    while bits:
+        low = bits & -bits
+        out.add(facts[low.bit_length() - 1])
+        bits ^= low
+    return out
+
+
+def df_bitvector(blocks, analysis, stats=None):
+    """Solve a `GenKill` analysis with the worklist algorithm.
+
+    Facts are interned to dense bit positions, and every value is a
+    Python integer used as a bit set, so merging is a single `|` or `&`
+    and the transfer function never allocates a set. The results are
+    decoded back to sets of facts at the end. `stats` works as in
+    `df_worklist`.
+    """
+    preds, succs = cfg.edges(blocks)
+    facts, gens, kills = analysis.gen_kill(blocks)
+    index = {f: i for i, f in enumerate(facts)}
+    gen = {name: to_bits(gens[name], index) for name in blocks}
+    keep = {name: ~to_bits(kills[name], index) for name in blocks}
+
+    # Switch between directions.
+    if analysis.forward:
+        first_block = list(blocks.keys())[0]  # Entry.
+        in_edges = preds
+        out_edges = succs
+    else:
+        first_block = list(blocks.keys())[-1]  # Exit.
+        in_edges = succs
+        out_edges = preds
+
+    # "May" analyses start at the empty set; "must" analyses start at the
+    # full set everywhere except the boundary.
+    top = (1 << len(facts)) - 1
+    in_ = {first_block: 0}
+    out = {node: 0 if analysis.may else top for node in blocks}
+
+    # Iterate.
+    worklist = Worklist(blocks, worklist_order(blocks, succs,
+                                               analysis.forward))
+    transfers = 0
+    while worklist:
+        node = worklist.pop()
+
+        inval = 0
+        if analysis.may:
+            for n in in_edges[node]:
+                inval |= out[n]
+        elif in_edges[node]:
+            inval = top
+            for n in in_edges[node]:
+                inval &= out[n]
+        in_[node] = inval
+
+        outval = gen[node] | (inval & keep[node])
+        transfers += 1
+
+        if outval != out[node]:
+            out[node] = outval
+            for n in out_edges[node]:
+                worklist.push(n)
+
+    if stats is not None:
+        stats['transfers'] = stats.get('transfers', 0) + transfers
+        stats['sweeps'] = stats.get('sweeps', 0) + worklist.sweeps
+
+    in_ = {node: from_bits(v, facts) for node, v in in_.items()}
+    out = {node: from_bits(v, facts) for node, v in out.items()}
+    if analysis.forward:
+        return in_, out
+    else:
+        return out, in_
+
+
 def fmt(val):
     """Guess a good way to format a data flow value. (Works for sets and
     dicts, at least.)
@@ -79,18 +263,27 @@ def fmt(val):
         return str(val)
 
 
-def run_df(bril, analysis):
+def run_df(bril, analysis, show_stats=False):
     for func in bril['functions']:
         # Form the CFG.
         blocks = cfg.block_map(form_blocks(func['instrs']))
         cfg.add_terminators(blocks)
 
-        in_, out = df_worklist(blocks, analysis)
+        stats = {}
+        if isinstance(analysis, GenKill):
+            in_, out = df_bitvector(blocks, analysis, stats)
+        else:
+            in_, out = df_worklist(blocks, analysis, stats)
         for block in blocks:
             print('{}:'.format(block))
             print('  in: ', fmt(in_[block]))
             print('  out:', fmt(out[block]))
 
+        if show_stats:
+            print('@{}: {} blocks, {} transfers, {} sweeps'.format(
+                func['name'], len(blocks), stats['transfers'], stats['sweeps'],
+            ), file=sys.stderr)
+
 
 def gen(block):
     """Variables that are written in the block.
@@ -136,24 +329,52 @@ def cprop_merge(vals_list):
     return out_vals
 
 
+def defined_gen_kill(blocks):
+    gens = {name: gen(block) for name, block in blocks.items()}
+    kills = {name: set() for name in blocks}
+    return sorted(union(gens.values())), gens, kills
+
+
+def live_gen_kill(blocks):
+    gens = {name: use(block) for name, block in blocks.items()}
+    kills = {name: gen(block) for name, block in blocks.items()}
+    facts = union(gens.values()) | union(kills.values())
+    return sorted(facts), gens, kills
+
+
+def reaching_gen_kill(blocks):
+    """Definitions are named `var@block:index` after the instruction
+    that assigns them.
+    """
+    facts = []
+    var_defs = defaultdict(set)
+    gens = {}
+    for name, block in blocks.items():
+        last_def = {}
+        for i, instr in enumerate(block):
+            if 'dest' in instr:
+                d = '{}@{}:{}'.format(instr['dest'], name, i)
+                facts.append(d)
+                var_defs[instr['dest']].add(d)
+                last_def[instr['dest']] = d
+        gens[name] = set(last_def.values())
+    kills = {name: union(var_defs[v] for v in gen(block))
+             for name, block in blocks.items()}
+    return facts, gens, kills
+
+
 ANALYSES = {
     # A really really basic analysis that just accumulates all the
     # currently-defined variables.
-    'defined': Analysis(
-        True,
-        init=set(),
-        merge=union,
-        transfer=lambda block, in_: in_.union(gen(block)),
-    ),
+    'defined': GenKill(True, may=True, gen_kill=defined_gen_kill),
 
     # Live variable analysis: the variables that are both defined at a
     # given point and might be read along some path in the future.
-    'live': Analysis(
-        False,
-        init=set(),
-        merge=union,
-        transfer=lambda block, out: use(block).union(out - gen(block)),
-    ),
+    'live': GenKill(False, may=True, gen_kill=live_gen_kill),
+
+    # Reaching definitions: the assignments whose values might still be
+    # held in their variables at a given point.
+    'reaching': GenKill(True, may=True, gen_kill=reaching_gen_kill),
 
     # A simple constant propagation pass.
     'cprop': Analysis(
@@ -165,5 +386,7 @@ ANALYSES = {
 }
 
 if __name__ == '__main__':
+    # With `-s`, report the number of transfer function evaluations and
+    # worklist sweeps for each function on standard error.
     bril = json.load(sys.stdin)
-    run_df(bril, ANALYSES[sys.argv[1]])
+    run_df(bril, ANALYSES[sys.argv[1]], '-s' in sys.argv[2:])
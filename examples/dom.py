@@ -1,8 +1,10 @@
+import heapq
 import json
 import sys
 
 from cfg import block_map, successors, add_terminators, add_entry
 from form_blocks import form_blocks
+from traversal import postorder, reverse_postorder, walk_tree
 
 
 def map_inv(succ):
@@ -18,25 +20,6 @@ def map_inv(succ):
     return out
 
 
-def postorder_helper(succ, root, explored, out):
-    """Given a successor edge map, produce a list of all the nodes in
-    the graph in postorder by appending to the `out` list.
-    """
-    if root in explored:
-        return
-    explored.add(root)
-
-    for s in succ[root]:
-        postorder_helper(succ, s, explored, out)
-    out.append(root)
-
-
-def postorder(succ, root):
-    out = []
-    postorder_helper(succ, root, set(), out)
-    return out
-
-
 def intersect(sets):
     sets = list(sets)
     if not sets:
@@ -104,20 +87,229 @@ def dom_tree(dom):
     }
 
 
+def _intersect(idom, order, b1, b2):
+    """Find the nearest common dominator of two nodes by walking up the
+    (partial) dominator tree, using RPO numbers to decide which finger
+    to advance.
+    """
+    while b1 != b2:
+        while order[b1] > order[b2]:
+            b1 = idom[b1]
+        while order[b2] > order[b1]:
+            b2 = idom[b2]
+    return b1
+
+
+def get_idoms(succs, preds, entry=0):
+    """Compute immediate dominators with the Cooper-Harvey-Kennedy
+    iterative algorithm.
+
+    The graph has integer nodes with successor and predecessor lists.
+    Produce a list mapping each node to its immediate dominator, with
+    None for the entry and for unreachable nodes. The algorithm only
+    stores one idom per node and typically converges in two passes over
+    the reverse postorder, so it is much cheaper than computing full
+    dominator sets.
+    """
+    rpo = reverse_postorder(succs, entry)
+    order = [None] * len(succs)
+    for i, node in enumerate(rpo):
+        order[node] = i
+
+    idom = [None] * len(succs)
+    idom[entry] = entry
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo[1:]:
+            new_idom = None
+            for p in preds[node]:
+                if idom[p] is None:
+                    continue  # Unreachable or not yet processed.
+                if new_idom is None:
+                    new_idom = p
+                else:
+                    new_idom = _intersect(idom, order, p, new_idom)
+            if idom[node] != new_idom:
+                idom[node] = new_idom
+                changed = True
+
+    idom[entry] = None
+    return idom
+
+
+def idom_tree(idom):
+    """Get the children of every node in the dominator tree, given an
+    immediate dominator list.
+    """
+    tree = [[] for _ in idom]
+    for node, parent in enumerate(idom):
+        if parent is not None:
+            tree[parent].append(node)
+    return tree
+
+
+def idom_fronts(idom, preds, entry=0):
+    """Compute every node's dominance frontier from the immediate
+    dominators: walk up the dominator tree from each predecessor of a
+    node until reaching the node's immediate dominator.
+    """
+    frontiers = [set() for _ in idom]
+    for node, ps in enumerate(preds):
+        if idom[node] is None and node != entry:
+            continue  # Unreachable.
+        for p in ps:
+            if idom[p] is None and p != entry:
+                continue
+            runner = p
+            while runner is not None and runner != idom[node]:
+                frontiers[runner].add(node)
+                runner = idom[runner]
+    return frontiers
+
+
+def dom_levels(tree, entry=0):
+    """Get every node's depth in the dominator tree (0 for the entry,
+    None for unreachable nodes).
+    """
+    levels = [None] * len(tree)
+    levels[entry] = 0
+    stack = [entry]
+    while stack:
+        node = stack.pop()
+        for child in tree[node]:
+            levels[child] = levels[node] + 1
+            stack.append(child)
+    return levels
+
+
+def join_levels(tree, succs, idom, levels, entry=0):
+    """For every node, find the shallowest level that a join edge (see
+    `iterated_fronts`) leaving its dominator subtree reaches. Nodes with
+    no such edges (or that are unreachable) get a level deeper than any
+    node's.
+    """
+    reach = [len(tree)] * len(tree)
+    for node, entering in walk_tree(tree, entry):
+        if entering:
+            continue
+        for s in succs[node]:
+            if idom[s] != node:
+                reach[node] = min(reach[node], levels[s])
+        for child in tree[node]:
+            reach[node] = min(reach[node], reach[child])
+    return reach
+
+
+def iterated_fronts(nodes, succs, idom, tree, levels, reach):
+    """Compute the iterated dominance frontier of a set of nodes, given
+    the immediate dominators, dominator tree, `dom_levels`, and
+    `join_levels`, using Sreedhar and Gao's algorithm on the DJ-graph.
+
+    The DJ-graph is the dominator tree plus the "join" edges: CFG edges
+    `y -> z` where `y` is not `z`'s immediate dominator. A node `z` is in
+    the frontier of `x` iff some join edge `y -> z` leaves `x`'s subtree
+    with `z` no deeper than `x`. We take nodes deepest first from a
+    priority queue (Sreedhar and Gao's "piggy bank") and search each
+    one's subtree for such edges; frontier nodes we find join the queue.
+    No subtree is searched twice, since a subtree already searched from
+    a deeper node has nothing new to find, and we skip subtrees whose
+    join edges all go too deep. So this takes time at worst linear in
+    the size of the graph (plus a logarithmic factor for the queue),
+    and usually much less.
+    """
+    # Nodes whose subtrees have no join edges shallow enough have
+    # nothing to find, so they never need to join the queue.
+    bank = [(-levels[node], node) for node in nodes
+            if levels[node] is not None and reach[node] <= levels[node]]
+    if not bank:
+        return set()
+    heapq.heapify(bank)
+    banked = set(nodes)
+
+    out = set()
+    visited = set()
+    while bank:
+        level, root = heapq.heappop(bank)
+        level = -level
+        visited.add(root)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for succ in succs[node]:
+                if levels[succ] <= level and idom[succ] != node and \
+                   succ not in out:
+                    out.add(succ)
+                    if succ not in banked and reach[succ] <= levels[succ]:
+                        banked.add(succ)
+                        heapq.heappush(bank, (-levels[succ], succ))
+            for child in tree[node]:
+                if reach[child] <= level and child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+    return out
+
+
+def idom_doms(idom, entry=0):
+    """Expand immediate dominators into full dominator sets (for every
+    reachable node, the set of nodes that dominate it).
+    """
+    doms = [set() for _ in idom]
+    for node in range(len(idom)):
+        if idom[node] is None and node != entry:
+            continue
+        runner = node
+        while runner is not None:
+            doms[node].add(runner)
+            runner = idom[runner]
+    return doms
+
+
+def dom_intervals(tree, entry=0):
+    """Number the dominator tree in preorder, producing `(enter, exit)`
+    pairs such that `a` dominates `b` iff `a`'s interval contains `b`'s.
+    (Use these with `dominates` for constant-time queries.)
+    """
+    intervals = [None] * len(tree)
+    counter = 0
+    for node, entering in walk_tree(tree, entry):
+        if entering:
+            intervals[node] = counter
+            counter += 1
+        else:
+            intervals[node] = (intervals[node], counter)
+    return intervals
+
+
+def dominates(intervals, a, b):
+    """Check whether `a` dominates `b`, given `dom_intervals`."""
+    if intervals[a] is None or intervals[b] is None:
+        return False
+    return intervals[a][0] <= intervals[b][0] < intervals[a][1]
+
+
 def print_dom(bril, mode):
     for func in bril['functions']:
         blocks = block_map(form_blocks(func['instrs']))
         add_entry(blocks)
         add_terminators(blocks)
-        succ = {name: successors(block[-1]) for name, block in blocks.items()}
-        dom = get_dom(succ, list(blocks.keys())[0])
+        names = list(blocks.keys())
+        ids = {name: i for i, name in enumerate(names)}
+        succs = [[ids[s] for s in successors(block[-1])]
+                 for block in blocks.values()]
+        preds = [[] for _ in names]
+        for i, ss in enumerate(succs):
+            for s in ss:
+                preds[s].append(i)
+        idom = get_idoms(succs, preds)
 
         if mode == 'front':
-            res = dom_fronts(dom, succ)
+            res = idom_fronts(idom, preds)
         elif mode == 'tree':
-            res = dom_tree(dom)
+            res = idom_tree(idom)
         else:
-            res = dom
+            res = idom_doms(idom)
+        res = {names[i]: [names[j] for j in v] for i, v in enumerate(res)}
 
         # Format as JSON for stable output.
         print(json.dumps(
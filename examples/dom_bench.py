@@ -0,0 +1,168 @@
+"""Compare the set-based dominator computation against the
+Cooper-Harvey-Kennedy (idom-based) engine on large synthetic CFGs, and
+two ways to find where phi-nodes go.
+
+Usage: python dom_bench.py [SHAPE] [SIZE...]
+
+For each size, generate a graph of the given shape (see `SHAPES`, which
+defaults to "random"), time both engines at computing dominators, the
+dominator tree, and dominance frontiers, and check that they agree.
+
+Then place phi-nodes for `size // VARS_PER` variables, each assigned in
+a few random blocks, by finding their iterated dominance frontiers in
+two ways: with Cytron et al.'s worklist over precomputed frontiers
+("df+"), and with Sreedhar and Gao's algorithm on the dominator tree
+("dj"). Both times include everything computed after the immediate
+dominators, and the results must agree.
+"""
+import random
+import sys
+import time
+
+from dom import get_dom, dom_tree, dom_fronts
+from dom import get_idoms, idom_tree, idom_fronts, idom_doms
+from dom import dom_levels, join_levels, iterated_fronts
+
+# One variable for this many blocks, each with at most `MAX_DEFS`
+# assignments.
+VARS_PER = 10
+MAX_DEFS = 4
+
+
+def synthetic_cfg(size, seed=0):
+    """Generate successor lists for a CFG with `size` blocks. Block 0 is
+    the entry and has no predecessors.
+    """
+    rand = random.Random(seed)
+    succs = []
+    for i in range(size):
+        ss = []
+        if i + 1 < size:
+            ss.append(i + 1)
+        if i > 0 and i + 2 < size and rand.random() < 0.3:
+            ss.append(rand.randrange(i + 2, min(size, i + 20)))  # Branch.
+        elif i > 1 and rand.random() < 0.1:
+            ss.append(rand.randrange(max(1, i - 20), i))  # Back edge.
+        succs.append(ss)
+    return succs
+
+
+def nested_loops(size):
+    """Generate successor lists for about `size` blocks forming a nest
+    of repeat-until loops: a row of loop headers, then their latches
+    from the innermost out, each of which jumps back to its header or on
+    to the next latch. Every header's dominance frontier holds all the
+    headers around it, so the frontiers add up to quadratic size.
+    """
+    depth = max(1, (size - 2) // 2)
+    succs = [[i + 1] for i in range(depth + 1)]  # Entry and headers.
+    for header in range(depth, 0, -1):
+        succs.append([header, len(succs) + 1])
+    succs.append([])  # Exit.
+    return succs
+
+
+# Ways to generate a graph, the sizes to try by default, and the largest
+# graph for which to run the (at least quadratic) set-based engine.
+SHAPES = {
+    # A chain of blocks with random forward branches and loop back edges.
+    'random': (synthetic_cfg, [250, 1000, 4000, 16000, 64000], 4000),
+    'nested': (nested_loops, [250, 1000, 2000], 1000),
+}
+
+
+def bench_sets(succs):
+    succ = {i: ss for i, ss in enumerate(succs)}
+    dom = get_dom(succ, 0)
+    return dom, dom_tree(dom), dom_fronts(dom, succ)
+
+
+def bench_idoms(succs):
+    preds = [[] for _ in succs]
+    for i, ss in enumerate(succs):
+        for s in ss:
+            preds[s].append(i)
+    idom = get_idoms(succs, preds)
+    return idom, idom_tree(idom), idom_fronts(idom, preds)
+
+
+def def_sets(size, seed=0):
+    """Pick the blocks that assign each of a graph's variables."""
+    rand = random.Random(seed)
+    return [rand.sample(range(size), rand.randint(1, MAX_DEFS))
+            for _ in range(max(1, size // VARS_PER))]
+
+
+def bench_df_plus(idom, preds, defs):
+    fronts = idom_fronts(idom, preds)
+    out = []
+    for nodes in defs:
+        idf = set()
+        work = list(nodes)
+        seen = set(nodes)
+        while work:
+            for node in fronts[work.pop()]:
+                if node not in idf:
+                    idf.add(node)
+                    if node not in seen:
+                        seen.add(node)
+                        work.append(node)
+        out.append(idf)
+    return out
+
+
+def bench_dj(idom, succs, defs):
+    tree = idom_tree(idom)
+    levels = dom_levels(tree)
+    reach = join_levels(tree, succs, idom, levels)
+    return [iterated_fronts(nodes, succs, idom, tree, levels, reach)
+            for nodes in defs]
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    res = f(*args)
+    return res, time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    shape = args.pop(0) if args and args[0] in SHAPES else 'random'
+    generate, default_sizes, max_sets = SHAPES[shape]
+    sizes = [int(a) for a in args] or default_sizes
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * max(sizes)))
+
+    print('{:>8} {:>12} {:>12} {:>12} {:>12}'.format(
+        'blocks', 'sets (ms)', 'idom (ms)', 'df+ (ms)', 'dj (ms)',
+    ))
+    for size in sizes:
+        succs = generate(size)
+        size = len(succs)
+        (idom, tree, fronts), t_idom = timed(bench_idoms, succs)
+
+        if size <= max_sets:
+            (dom, old_tree, old_fronts), t_sets = timed(bench_sets, succs)
+            doms = idom_doms(idom)
+            assert all(doms[i] == dom[i] for i in range(size))
+            assert all(set(tree[i]) == old_tree[i] for i in range(size))
+            assert all(fronts[i] == set(old_fronts[i]) for i in range(size))
+            sets_ms = '{:.1f}'.format(t_sets * 1000)
+        else:
+            sets_ms = '-'
+
+        preds = [[] for _ in succs]
+        for i, ss in enumerate(succs):
+            for s in ss:
+                preds[s].append(i)
+        defs = def_sets(size)
+        df_plus, t_df_plus = timed(bench_df_plus, idom, preds, defs)
+        dj, t_dj = timed(bench_dj, idom, succs, defs)
+        assert df_plus == dj
+
+        print('{:>8} {:>12} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+            size, sets_ms, t_idom * 1000, t_df_plus * 1000, t_dj * 1000,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,37 @@
-import json
+"""Convert Bril functions out of SSA form.
+
+    bril2json < prog.bril | python to_ssa.py | python from_ssa.py [naive]
+
+The naive translation replaces every phi-node with a copy at the end of
+each predecessor. That is wrong when a predecessor has other successors
+where the phi-node's destination is live (the "lost copy" problem) or
+when the phi-nodes in a block read each other (the "swap" problem), and
+it costs a copy on every edge.
+
+By default, we do better. First, we coalesce: every phi-node argument
+whose live range does not interfere with its destination's (or with any
+name already merged with it) is renamed to the same variable, so no copy
+is needed on its edge. The remaining copies on each edge happen in
+parallel, so we sequentialize them in an order that never overwrites a
+value before it is read, using a temporary to break cycles. The copies
+go at the end of the predecessor if it has no other successors, and in a
+new block that splits the edge otherwise.
+"""
+
 import sys
+from collections import OrderedDict, defaultdict
 
-from cfg import block_map, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
+from cfg import CFG, reassemble, drop_fallthroughs
+from util import fresh, load_json, dump_json
 
 
-def func_from_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
+def func_from_ssa_naive(func, cfg=None):
+    """Replace the phi-nodes in a function with copies, optionally
+    reusing a `CFG` that was already built for it.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
 
     # Replace each phi-node.
     for block in blocks.values():
@@ -37,11 +60,258 @@ def func_from_ssa(func):
     func['instrs'] = reassemble(blocks)
 
 
-def from_ssa(bril):
+def liveness(blocks, succ, defined):
+    """Compute the variables live on exit from every block of an SSA
+    function. A phi-node's arguments count as used at the end of the
+    predecessors they come from, and its destination as assigned at the
+    top of its block. Only variables in `defined` are tracked.
+    """
+    uses, defs = {}, {}
+    phi_uses = defaultdict(set)
+    for name, block in blocks.items():
+        used, assigned = set(), set()
+        for instr in block:
+            if instr['op'] == 'phi':
+                for label, arg in zip(instr['labels'], instr['args']):
+                    if arg in defined:
+                        phi_uses[label].add(arg)
+            else:
+                used.update(a for a in instr.get('args', ())
+                            if a in defined and a not in assigned)
+            if 'dest' in instr:
+                assigned.add(instr['dest'])
+        uses[name], defs[name] = used, assigned
+
+    live_in = {name: set() for name in blocks}
+    live_out = {name: set() for name in blocks}
+    changed = True
+    while changed:
+        changed = False
+        for name in reversed(blocks):
+            out = set(phi_uses[name])
+            for s in succ[name]:
+                out |= live_in[s]
+            live_out[name] = out
+            new_in = uses[name] | (out - defs[name])
+            if new_in != live_in[name]:
+                live_in[name] = new_in
+                changed = True
+    return live_out
+
+
+def interference(blocks, live_out, defined, params, entry):
+    """Build the interference graph of an SSA function: a map from every
+    variable to the ones live where it is assigned. The destination of
+    a copy does not interfere with its source, since they hold the same
+    value. All the phi-nodes in a block (and all the parameters) are
+    assigned at once, so they interfere with each other.
+    """
+    graph = defaultdict(set)
+
+    def interfere(var, live):
+        for other in live:
+            if other != var:
+                graph[var].add(other)
+                graph[other].add(var)
+
+    for name, block in blocks.items():
+        live = set(live_out[name])
+        for instr in reversed(block):
+            if instr['op'] == 'phi':
+                continue
+            if 'dest' in instr:
+                source = instr['args'][0] if instr['op'] == 'id' else None
+                interfere(instr['dest'], live - {source})
+                live.discard(instr['dest'])
+            live.update(a for a in instr.get('args', ()) if a in defined)
+
+        at_top = {instr['dest'] for instr in block if instr['op'] == 'phi'}
+        if name == entry:
+            at_top |= set(params)
+        for var in at_top:
+            interfere(var, live | at_top)
+    return graph
+
+
+def coalesce(blocks, graph, defined, params):
+    """Merge each phi-node's destination with its arguments unless that
+    would make two interfering variables share a name. Return a map from
+    every merged variable to its new name: a parameter if the class has
+    one, or else the first phi-node destination merged into it.
+    """
+    leader = {}  # Variable to its class's leader.
+    members = {}  # Leader to the class's variables.
+    neighbors = {}  # Leader to the variables interfering with the class.
+    name = {}  # Leader to the class's name.
+
+    def find(var):
+        if var not in leader:
+            leader[var] = var
+            members[var] = {var}
+            neighbors[var] = set(graph[var])
+            name[var] = var
+        return leader[var]
+
+    for block in blocks.values():
+        for instr in block:
+            if instr['op'] != 'phi':
+                continue
+            for arg in instr['args']:
+                if arg not in defined:
+                    continue
+                a, d = find(arg), find(instr['dest'])
+                if a == d or members[a] & neighbors[d]:
+                    continue
+                if name[a] in params and name[d] in params:
+                    continue
+                new = name[a] if name[a] in params else name[d]
+
+                # Merge the smaller class into the larger one.
+                if len(members[a]) < len(members[d]):
+                    a, d = d, a
+                for var in members[d]:
+                    leader[var] = a
+                members[a] |= members.pop(d)
+                neighbors[a] |= neighbors.pop(d)
+                name.pop(d)
+                name[a] = new
+
+    return {var: name[leader[var]] for var in leader
+            if name[leader[var]] != var}
+
+
+def sequentialize(copies, temp):
+    """Order a parallel copy, given as a list of (dest, source) pairs
+    with distinct destinations, into a list of sequential copies. Cycles
+    are broken by saving a value in the variable `temp()` returns.
+    """
+    pending = OrderedDict((d, s) for d, s in copies if d != s)
+    readers = defaultdict(int)
+    for s in pending.values():
+        readers[s] += 1
+
+    out = []
+    while pending:
+        # Copy into every destination that no pending copy still reads.
+        ready = [d for d in pending if not readers[d]]
+        if ready:
+            for d in ready:
+                s = pending.pop(d)
+                out.append((d, s))
+                readers[s] -= 1
+            continue
+
+        # What remains is cycles. Save one destination's value and read
+        # it from the temporary instead.
+        d = next(iter(pending))
+        t = temp()
+        out.append((t, d))
+        for dest, s in pending.items():
+            if s == d:
+                pending[dest] = t
+        readers[t] = readers.pop(d)
+        readers[d] = 0
+    return out
+
+
+def func_from_ssa(func, cfg=None):
+    """Convert a function out of SSA form, coalescing the names related
+    by phi-nodes where possible, and optionally reusing a `CFG` that was
+    already built for it. Splitting edges changes control flow, so the
+    CFG is stale afterward.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
+    succ = cfg.succ_map()
+    entry = cfg.names[cfg.entry]
+    params = [a['name'] for a in func.get('args', [])]
+
+    defined = set(params)
+    names = set(params)
+    for block in blocks.values():
+        for instr in block:
+            if 'dest' in instr:
+                defined.add(instr['dest'])
+            names.update(instr.get('args', ()))
+    names |= defined
+
+    live_out = liveness(blocks, succ, defined)
+    graph = interference(blocks, live_out, defined, params, entry)
+    rename = coalesce(blocks, graph, defined, set(params))
+
+    def new(var):
+        return rename.get(var, var)
+
+    # Collect the parallel copies on each edge, and drop the phi-nodes.
+    copies = defaultdict(list)  # (pred, block) to (dest, arg) pairs.
+    types = {}
+    for name, block in blocks.items():
+        for instr in block:
+            if instr['op'] == 'phi':
+                types[new(instr['dest'])] = instr['type']
+                for label, arg in zip(instr['labels'], instr['args']):
+                    if arg in defined:
+                        copies[label, name].append((new(instr['dest']),
+                                                    new(arg)))
+        block[:] = [i for i in block if i['op'] != 'phi']
+
+    # Rename everything else.
+    for block in blocks.values():
+        for instr in block:
+            if 'dest' in instr:
+                instr['dest'] = new(instr['dest'])
+            if 'args' in instr:
+                instr['args'] = [new(a) for a in instr['args']]
+
+    def temp():
+        var = fresh('_swap', names)
+        names.add(var)
+        return var
+
+    # Insert the copies, splitting edges where the predecessor has other
+    # successors. A new block goes just before its target if the edge
+    # goes backward in the layout (so each trip around a loop falls
+    # through it), and just after its source otherwise.
+    labels = set(blocks)
+    before = defaultdict(OrderedDict)
+    after = defaultdict(OrderedDict)
+    for (pred, name), pairs in copies.items():
+        seq = []
+        for dest, src in sequentialize(pairs, temp):
+            types.setdefault(dest, types.get(src))  # Temporaries.
+            seq.append({'op': 'id', 'dest': dest, 'args': [src],
+                        'type': types[dest]})
+        if not seq:
+            continue
+        if len(succ[pred]) == 1:
+            blocks[pred][-1:-1] = seq
+            continue
+
+        label = fresh('{}.{}.'.format(pred, name), labels)
+        labels.add(label)
+        where = before[name] if cfg.ids[pred] >= cfg.ids[name] \
+            else after[pred]
+        where[label] = seq + [{'op': 'jmp', 'labels': [name]}]
+        term = blocks[pred][-1]
+        term['labels'] = [label if lbl == name else lbl
+                          for lbl in term['labels']]
+
+    new_blocks = OrderedDict()
+    for name, block in blocks.items():
+        new_blocks.update(before.get(name, {}))
+        new_blocks[name] = block
+        new_blocks.update(after.get(name, {}))
+    func['instrs'] = reassemble(new_blocks)
+    drop_fallthroughs(func)
+
+
+def from_ssa(bril, naive=False):
+    convert = func_from_ssa_naive if naive else func_from_ssa
     for func in bril['functions']:
-        func_from_ssa(func)
+        convert(func)
     return bril
 
 
 if __name__ == '__main__':
-    print(json.dumps(from_ssa(json.load(sys.stdin)), indent=2, sort_keys=True))
+    dump_json(from_ssa(load_json(), 'naive' in sys.argv[1:]))
@@ -0,0 +1,256 @@
+"""Dominator-based global value numbering for Bril programs in SSA form.
+
+Local value numbering (`lvn.py`) forgets everything at block boundaries.
+Here, we walk the dominator tree instead, and a value computed in a
+block stays available in every block it dominates. Because the input is
+in SSA form, every variable has a single definition, so only the table
+of available computations needs to be scoped; variable numbers are
+global.
+
+    bril2json < prog.bril | python to_ssa.py | python gvn.py | python tdce.py
+
+Redundant computations become copies (or constants), and every use is
+rewritten to the canonical variable for its value, so the copies are
+left dead for `tdce.py` to delete.
+"""
+
+from cfg import CFG, reassemble
+from form_blocks import TERMINATORS
+from lvn import Value, Numbering, _canonicalize, _fold
+from util import load_json, dump_json
+
+# Operations that compute a value from their arguments alone, so two
+# executions with the same arguments produce the same result. (Calls,
+# memory operations, and allocations are not among them.)
+PURE_OPS = {
+    'id', 'add', 'mul', 'sub', 'div', 'eq', 'lt', 'gt', 'le', 'ge',
+    'not', 'and', 'or',
+    'fadd', 'fmul', 'fsub', 'fdiv', 'feq', 'flt', 'fgt', 'fle', 'fge',
+    'ceq', 'clt', 'cgt', 'cle', 'cge', 'char2int', 'int2char',
+    'ptradd',
+}
+
+
+def clobber_zone(header, succ, pred):
+    """Find the blocks where the destinations of a block's phi-nodes may
+    no longer hold their values.
+
+    Leaving SSA form assigns phi-node destinations at the end of every
+    predecessor of their block. After that, along an edge that does not
+    lead back into the block (a loop exit from the latch, say), a read of
+    the destination sees the next iteration's value, not the current one.
+    """
+    zone = set()
+    work = [s for p in pred[header] for s in succ[p] if s != header]
+    while work:
+        name = work.pop()
+        if name not in zone:
+            zone.add(name)
+            work += [s for s in succ[name] if s != header]
+    return zone
+
+
+def gvn_pass(func, cfg):
+    """Number the values in an SSA function in one walk over its
+    dominator tree, eliminating redundant computations in place.
+
+    Return True if another walk could find more redundancy: a phi-node
+    was numbered before the definitions along its back edges, and those
+    turned out to be copies of one value.
+    """
+    blocks = cfg.blocks(func)
+    dom_tree = cfg.dom_tree
+    succ = cfg.succ_map()
+    pred = cfg.pred_map()
+
+    # The value number of every variable, the canonical variable for
+    # every number, and the constant value of numbers that are constant.
+    var2num = Numbering()
+    num2var = {}
+    num2const = {}
+
+    # The computations available at the current point of the walk.
+    value2num = {}
+
+    # Phi-node destinations are the only variables that get assigned
+    # more than once after leaving SSA form, so we must take care when
+    # introducing new uses of them.
+    phi_blocks = {instr['dest']: name for name, block in blocks.items()
+                  for instr in block if instr['op'] == 'phi'}
+    zones = {}
+
+    def safe(var, name, term):
+        """Check whether a new use of a variable in a block (in its
+        terminator, if `term`) is safe. If `name` is None, the use is a
+        phi-node argument, and we only allow non-phi variables there.
+        """
+        if var not in phi_blocks:
+            return True
+        if name is None:
+            return False
+        header = phi_blocks[var]
+        if header not in zones:
+            zones[header] = clobber_zone(header, succ, pred)
+        return name not in zones[header] and \
+            not (term and name in pred[header])
+
+    def canonical(var, name=None, term=False):
+        """Get the variable to use in place of `var` in a block."""
+        if var not in var2num:
+            return var
+        canon = num2var[var2num[var]]
+        return canon if safe(canon, name, term) else var
+
+    def number(var):
+        """Get the number for a variable that has not been defined yet
+        in the walk (a function argument, for instance): it is its own
+        canonical source.
+        """
+        if var not in var2num:
+            num2var[var2num.add(var)] = var
+        return var2num[var]
+
+    def replace(instr, num, name):
+        """Turn an instruction in a block into a copy of (or constant
+        for) a value that is already available, if we can. Return True
+        on success.
+        """
+        new = {'dest': instr['dest'], 'type': instr['type']}
+        if num in num2const:
+            new.update({'op': 'const', 'value': num2const[num]})
+        elif safe(num2var[num], name, False):
+            new.update({'op': 'id', 'args': [num2var[num]]})
+        else:
+            return False
+        var2num[instr['dest']] = num
+        instr.clear()
+        instr.update(new)
+        return True
+
+    def visit(name):
+        """Number the instructions in a block. Return the list of values
+        that became available, so we can remove them again when leaving
+        the block's subtree.
+        """
+        added = []
+        for instr in blocks[name]:
+            op = instr['op']
+            if op == 'phi':
+                # A phi-node whose arguments all have the same number is
+                # a copy of that number; otherwise, phi-nodes in the same
+                # block with the same arguments are equivalent. Arguments
+                # along back edges are not numbered yet, so such a phi-node
+                # just gets a fresh number.
+                if all(a in var2num for a in instr['args']):
+                    argnums = tuple(var2num[a] for a in instr['args'])
+                    if len(set(argnums)) == 1 and \
+                       replace(instr, argnums[0], name):
+                        continue
+                    val = Value('phi', (name, tuple(instr['labels']),
+                                        argnums))
+                    if val in value2num and \
+                       replace(instr, value2num[val], name):
+                        continue
+                    num = var2num.add(instr['dest'])
+                    if val not in value2num:
+                        value2num[val] = num
+                        added.append(val)
+                else:
+                    num = var2num.add(instr['dest'])
+                num2var[num] = instr['dest']
+                continue
+
+            # Number the arguments and rewrite them to canonical
+            # variables. (In SSA form, definitions dominate uses, so
+            # every argument except a function argument has a number.)
+            argnums = tuple(number(a) for a in instr.get('args', []))
+            if 'args' in instr:
+                term = op in TERMINATORS
+                instr['args'] = [canonical(a, name, term)
+                                 for a in instr['args']]
+
+            if 'dest' not in instr:
+                continue
+
+            if op == 'const':
+                # Compare literals by their text, so that `0.0` and
+                # `-0.0` (or `1` and `true`) stay apart.
+                val = Value('const', (instr['type'], repr(instr['value'])))
+            elif op in PURE_OPS:
+                val = _canonicalize(Value(op, argnums))
+            else:
+                val = None
+
+            if op == 'id':
+                # Copies have the number of the value they copy.
+                num = argnums[0]
+            elif val is not None and val in value2num:
+                num = value2num[val]
+            else:
+                num = None
+
+            if num is not None and replace(instr, num, name):
+                continue
+
+            num = var2num.add(instr['dest'])
+            num2var[num] = instr['dest']
+            if op == 'const':
+                num2const[num] = instr['value']
+            elif val is not None:
+                const = _fold(num2const, val)
+                if const is not None:
+                    num2const[num] = const
+                    instr.pop('args')
+                    instr.update({'op': 'const', 'value': const})
+            if val is not None and val not in value2num:
+                value2num[val] = num
+                added.append(val)
+        return added
+
+    # Walk the dominator tree in preorder, with an explicit stack.
+    # Entries are block names to visit or, to leave a subtree, lists of
+    # values to make unavailable again.
+    stack = [cfg.names[cfg.entry]]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            for val in item:
+                del value2num[val]
+            continue
+        stack.append(visit(item))
+        stack += reversed(dom_tree[item])
+
+    # Now that every definition is numbered, rewrite phi-node arguments
+    # to canonical variables too.
+    again = False
+    for block in blocks.values():
+        for instr in block:
+            if instr['op'] == 'phi':
+                args = [canonical(a) for a in instr['args']]
+                if args != instr['args']:
+                    instr['args'] = args
+                    again = again or len(set(args)) == 1
+
+    func['instrs'] = reassemble(blocks)
+    return again
+
+
+def gvn_func(func, cfg=None):
+    """Apply global value numbering to an SSA function, optionally
+    reusing a `CFG` that was already built for it. Modify the function in
+    place. The pass does not change control flow.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    while gvn_pass(func, cfg):
+        pass
+
+
+def gvn(bril):
+    for func in bril['functions']:
+        gvn_func(func)
+    return bril
+
+
+if __name__ == '__main__':
+    dump_json(gvn(load_json()))
@@ -0,0 +1,394 @@
+"""Induction variables and strength reduction for Bril programs in SSA
+form.
+
+    bril2json < prog.bril | python to_ssa.py | python indvars.py | \\
+        python from_ssa.py | python tdce.py
+
+A basic induction variable is an integer phi-node in a loop's header
+that every trip around the loop increases by the same loop-invariant
+step. A derived induction variable is an affine function of a basic one,
+`scale * i + offset`, where the scale and offset are loop-invariant: an
+integer constant or a variable defined outside the loop. We find them by
+looking at the additions, subtractions, multiplications, and copies in
+the loop body.
+
+Strength reduction replaces every multiplication that computes a derived
+induction variable with a new basic induction variable: it starts at
+`scale * init + offset` in the loop's preheader and then increases by
+`scale * step` with an addition on every iteration. The loops are
+visited innermost first, so a multiplication that one loop's reduction
+puts into its preheader may be reduced again by an enclosing loop.
+"""
+
+from collections import namedtuple
+
+from cfg import CFG, reassemble, drop_fallthroughs
+from loops import natural_loops, preheader, add_preheaders
+from util import fresh, wrap_int, load_json, dump_json
+
+# A derived induction variable, with the value `scale * basic + offset`.
+# `basic` is the destination of a phi-node for a basic induction
+# variable. `scale` and `offset` are loop-invariant terms: either int
+# constants or the names of variables defined outside the loop.
+IndVar = namedtuple('IndVar', ['basic', 'scale', 'offset'])
+
+# A basic induction variable's value on entry to the loop (the name of a
+# variable) and the term it increases by on every iteration.
+BasicIV = namedtuple('BasicIV', ['init', 'step'])
+
+# Comparisons we can evaluate to compute trip counts.
+COMPARISONS = {
+    'eq': lambda a, b: a == b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+}
+
+# The comparison with its operands swapped.
+FLIPPED = {'eq': 'eq', 'lt': 'gt', 'gt': 'lt', 'le': 'ge', 'ge': 'le'}
+
+# Give up on counting a loop's trips after this many.
+MAX_TRIPS = 10000
+
+
+def add_terms(a, b):
+    """Add two terms, or return None if the sum is not a term."""
+    if isinstance(a, int) and isinstance(b, int):
+        return wrap_int(a + b)
+    if a == 0:
+        return b
+    if b == 0:
+        return a
+    return None
+
+
+def mul_terms(a, b):
+    """Multiply two terms, or return None if the product is not a term."""
+    if isinstance(a, int) and isinstance(b, int):
+        return wrap_int(a * b)
+    if a == 0 or b == 0:
+        return 0
+    if a == 1:
+        return b
+    if b == 1:
+        return a
+    return None
+
+
+def affine(instr, forms, term):
+    """Get the `IndVar` an instruction computes, given the induction
+    variables found so far and a function that gets a variable's
+    loop-invariant term (or None). Return None if the result is not an
+    induction variable.
+    """
+    op = instr['op']
+    args = instr.get('args', [])
+    if op == 'id':
+        return forms.get(args[0])
+    if op not in ('add', 'sub', 'mul'):
+        return None
+
+    a, b = args
+    if op != 'sub' and a not in forms:
+        a, b = b, a  # Commute to put the induction variable first.
+    form, t = forms.get(a), term(b)
+    if form is None or t is None:
+        return None
+
+    if op == 'add':
+        offset = add_terms(form.offset, t)
+        scale = form.scale
+    elif op == 'sub':
+        if not isinstance(t, int):
+            return None
+        offset = add_terms(form.offset, -t)
+        scale = form.scale
+    else:
+        offset = mul_terms(form.offset, t)
+        scale = mul_terms(form.scale, t)
+    if offset is None or scale is None:
+        return None
+    return IndVar(form.basic, scale, offset)
+
+
+class LoopVars:
+    """The induction variables of a natural loop in an SSA function.
+
+    The loop must have a preheader (see `loops.add_preheaders`). Given
+    the function's block map and `CFG`, a map from the names of its
+    integer constants to their values, and the set of all the variables
+    it defines (including parameters), we find:
+
+    - basics: A map from the phi-nodes for basic induction variables to
+      their `BasicIV`s.
+    - forms: A map from variables in the loop to their `IndVar`s,
+      including the basic induction variables themselves.
+    """
+
+    def __init__(self, blocks, cfg, loop, consts, defined):
+        self.blocks = blocks
+        self.loop = loop
+        self.consts = consts
+        self.defined = defined
+        self.header = cfg.names[loop.header]
+        self.pre = cfg.names[preheader(cfg, loop)]
+        self.latches = [cfg.names[b] for b in loop.latches]
+        order = {b: i for i, b in enumerate(cfg.rpo)}
+        self.body = [cfg.names[b] for b in sorted(loop.body, key=order.get)]
+        self.inside = {instr['dest'] for name in self.body
+                       for instr in blocks[name] if 'dest' in instr}
+
+        phis = {instr['dest']: instr for instr in blocks[self.header]
+                if instr['op'] == 'phi' and instr['type'] == 'int'}
+        basics = set(phis)
+        while True:
+            # Assume the candidates are all basic induction variables, and
+            # then rule out the ones whose updates do not fit.
+            forms = {b: IndVar(b, 1, 0) for b in basics}
+            for name in self.body:
+                for instr in blocks[name]:
+                    if instr.get('type') == 'int' and instr['op'] != 'phi':
+                        form = affine(instr, forms, self.term)
+                        if form is not None:
+                            forms[instr['dest']] = form
+
+            self.basics = {}
+            for b in basics:
+                init, updates = None, set()
+                for label, arg in zip(phis[b]['labels'], phis[b]['args']):
+                    if label == self.pre:
+                        init = arg
+                    else:
+                        updates.add(arg)
+                form = forms.get(updates.pop()) if len(updates) == 1 \
+                    else None
+                if init in defined and form is not None and \
+                   form.basic == b and form.scale == 1:
+                    self.basics[b] = BasicIV(init, form.offset)
+            if len(self.basics) == len(basics):
+                break
+            basics = set(self.basics)
+        self.forms = forms
+
+    def term(self, var):
+        """Get a variable's loop-invariant term: its value if it is an
+        integer constant, or its name if it is defined outside the loop.
+        Otherwise, return None.
+        """
+        if var in self.consts:
+            return self.consts[var]
+        if var in self.inside or var not in self.defined:
+            return None
+        return var
+
+    def trip_count(self, defs):
+        """Count the iterations of the loop, if the header decides
+        whether to exit by comparing an induction variable with a
+        constant and the loop starts from a constant. Return the number
+        of times the header branches back into the loop, or None if we
+        cannot tell (or there are more than `MAX_TRIPS`). `defs` maps
+        every variable in the function to its defining instruction.
+        """
+        term = self.blocks[self.header][-1]
+        if term['op'] != 'br':
+            return None
+        stay = [label in self.body for label in term['labels']]
+        if stay.count(True) != 1:
+            return None
+        stay_on = stay[0]
+
+        cond = defs.get(term['args'][0])
+        while cond is not None and cond['op'] == 'id':
+            cond = defs.get(cond['args'][0])
+        if cond is None or cond['op'] not in COMPARISONS:
+            return None
+
+        # Put the induction variable on the left.
+        op = cond['op']
+        left, right = cond['args']
+        if left not in self.forms:
+            left, right = right, left
+            op = FLIPPED[op]
+        form = self.forms.get(left)
+        bound = self.term(right)
+        if form is None or not isinstance(bound, int) or \
+           not isinstance(form.scale, int) or \
+           not isinstance(form.offset, int):
+            return None
+        basic = self.basics[form.basic]
+        value = self.consts.get(self.origin(basic.init, defs))
+        if value is None or not isinstance(basic.step, int):
+            return None
+
+        for trips in range(MAX_TRIPS + 1):
+            current = wrap_int(form.scale * value + form.offset)
+            if COMPARISONS[op](current, bound) != stay_on:
+                return trips
+            value = wrap_int(value + basic.step)
+        return None
+
+    @staticmethod
+    def origin(var, defs):
+        """Follow a chain of copies back to the variable it starts at."""
+        instr = defs.get(var)
+        while instr is not None and instr['op'] == 'id':
+            var = instr['args'][0]
+            instr = defs.get(var)
+        return var
+
+
+def int_consts(func):
+    """Map the names of the integer constants in a function to their
+    values.
+    """
+    return {instr['dest']: instr['value'] for instr in func['instrs']
+            if instr.get('op') == 'const' and instr['type'] == 'int'}
+
+
+def is_ssa(func):
+    """Check whether every variable in a function is assigned at most
+    once (counting parameters as assignments).
+    """
+    names = [a['name'] for a in func.get('args', [])]
+    names += [instr['dest'] for instr in func['instrs'] if 'dest' in instr]
+    return len(names) == len(set(names))
+
+
+def reduce_loop(lv, names):
+    """Strength-reduce the multiplications in a loop, given its
+    `LoopVars`. Fresh variable names are drawn from (and added to)
+    `names`. Return a map from the destinations of the deleted
+    multiplications to the variables that replace them.
+    """
+    blocks = lv.blocks
+    pre_code = []
+
+    def emit(seed, op, *args, value=None):
+        dest = fresh(seed, names)
+        names.add(dest)
+        instr = {'op': op, 'dest': dest, 'type': 'int'}
+        if op == 'const':
+            instr['value'] = value
+            lv.consts[dest] = value
+        else:
+            instr['args'] = list(args)
+        pre_code.append(instr)
+        return dest
+
+    made = {}
+
+    def var(seed, term):
+        # Get a variable for a term, making constants as needed.
+        if not isinstance(term, int):
+            return term
+        if term not in made:
+            made[term] = emit(seed, 'const', value=term)
+        return made[term]
+
+    replaced = {}
+    by_form = {}
+    head_code = []
+    for name in lv.body:
+        for instr in blocks[name]:
+            if instr['op'] != 'mul' or instr['dest'] not in lv.forms:
+                continue
+            form = lv.forms[instr['dest']]
+            if form not in by_form:
+                seed = instr['dest'] + '.sr'
+                basic = lv.basics[form.basic]
+
+                # Fold as much as we can into constants.
+                init = lv.term(basic.init)
+                start = mul_terms(init, form.scale)
+                if start is None:
+                    start = emit(seed, 'mul', var(seed, init),
+                                 var(seed, form.scale))
+                offset = add_terms(start, form.offset)
+                if offset is None:
+                    offset = emit(seed, 'add', var(seed, start),
+                                  var(seed, form.offset))
+                start = var(seed, offset)
+                stride = mul_terms(basic.step, form.scale)
+                if stride is None:
+                    stride = emit(seed, 'mul', var(seed, basic.step),
+                                  var(seed, form.scale))
+                stride = var(seed, stride)
+
+                iv = fresh(instr['dest'] + '.iv', names)
+                after = fresh(instr['dest'] + '.next', names)
+                names.update([iv, after])
+                head_code.append({
+                    'op': 'phi', 'dest': iv, 'type': 'int',
+                    'labels': [lv.pre] + lv.latches,
+                    'args': [start] + [after] * len(lv.latches),
+                })
+                head_code.append({'op': 'add', 'dest': after, 'type': 'int',
+                                  'args': [iv, stride]})
+                by_form[form] = iv
+            replaced[instr['dest']] = by_form[form]
+
+    if not replaced:
+        return replaced
+    for name in lv.body:
+        blocks[name] = [i for i in blocks[name]
+                        if i.get('dest') not in replaced]
+    blocks[lv.pre][-1:-1] = pre_code
+
+    # The new phi-nodes go with the others at the top of the header, and
+    # the additions go right after them.
+    header = blocks[lv.header]
+    phis = [i for i in head_code if i['op'] == 'phi']
+    adds = [i for i in head_code if i['op'] != 'phi']
+    split = sum(1 for i in header if i['op'] == 'phi')
+    header[:split] = header[:split] + phis + adds
+    return replaced
+
+
+def strength_reduce_func(func):
+    """Strength-reduce the multiplications by induction variables in an
+    SSA function. Functions that are not in SSA form are left alone.
+    """
+    if not is_ssa(func):
+        return
+    original = [dict(instr) for instr in func['instrs']]
+    cfg = CFG(func)
+    if add_preheaders(func, cfg):
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
+    consts = int_consts(func)
+    names = {a['name'] for a in func.get('args', [])}
+    names.update(instr['dest'] for instr in func['instrs']
+                 if 'dest' in instr)
+
+    replaced = {}
+    for loop in natural_loops(cfg):
+        if preheader(cfg, loop) is None:
+            continue  # Unreachable.
+        lv = LoopVars(blocks, cfg, loop, consts, names)
+        new = reduce_loop(lv, names)
+        if new:
+            # Use the new variables everywhere before looking at the
+            # enclosing loops.
+            replaced.update(new)
+            for block in blocks.values():
+                for instr in block:
+                    if 'args' in instr:
+                        instr['args'] = [replaced.get(a, a)
+                                         for a in instr['args']]
+
+    if replaced:
+        func['instrs'] = reassemble(blocks)
+        drop_fallthroughs(func)
+    else:
+        func['instrs'] = original
+
+
+def strength_reduce(bril):
+    for func in bril['functions']:
+        strength_reduce_func(func)
+    return bril
+
+
+if __name__ == '__main__':
+    dump_json(strength_reduce(load_json()))
@@ -0,0 +1,291 @@
+"""Inline function calls in a Bril program.
+
+    bril2json < prog.bril | python inline.py [PROFILE] | python tdce.py
+
+We build the call graph, find its strongly connected components, and
+visit them bottom-up, so a function's callees are already inlined into
+it by the time it gets inlined anywhere else. Functions in recursive
+components are never inlined.
+
+Whether to inline a call site depends on the size of the callee and, if
+a profile from `profiler.py` is given, on how often the site ran: sites
+that never ran are left alone, and hot sites may inline larger callees.
+Each function may only grow by a limited amount.
+
+Inlining turns the callee's parameters into copies of the arguments
+(unless the callee never assigns them, in which case we use the
+arguments directly) and its returns into copies to the call's
+destination and jumps past the inlined body. The callee's variables and
+labels are renamed so they cannot clash with the caller's. Functions
+with phi-nodes (in SSA form) are left alone, since splitting their
+blocks would invalidate the labels in phi-nodes.
+"""
+
+import sys
+
+from cfg import block_map
+from form_blocks import form_blocks
+from profiler import load_profile
+from util import fresh, load_json, dump_json
+
+# Inline callees with at most this many instructions...
+MAX_CALLEE = 25
+# ...or this many, at call sites that ran at least HOT_CALLS times.
+MAX_HOT_CALLEE = 100
+HOT_CALLS = 100
+
+# Every function may grow to GROWTH times its size or by MIN_BUDGET
+# instructions, whichever is more.
+GROWTH = 2.0
+MIN_BUDGET = 50
+
+
+def call_graph(bril):
+    """Map each function's name to the list of functions it calls."""
+    names = {func['name'] for func in bril['functions']}
+    graph = {}
+    for func in bril['functions']:
+        callees = {}
+        for instr in func['instrs']:
+            if instr.get('op') == 'call':
+                for callee in instr.get('funcs', []):
+                    if callee in names:
+                        callees[callee] = None
+        graph[func['name']] = list(callees)
+    return graph
+
+
+def strongly_connected(graph):
+    """Find the strongly connected components of a graph with Tarjan's
+    algorithm, using an explicit stack instead of recursion. Components
+    come out in reverse topological order: every component comes after
+    the ones it has edges to.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+
+        while work:
+            node, succs = work[-1]
+            for succ in succs:
+                if succ not in index:
+                    # Descend into the successor; come back to the rest of
+                    # this node's successors later.
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def size(func):
+    """Count the instructions (not labels) in a function."""
+    return sum(1 for instr in func['instrs'] if 'op' in instr)
+
+
+def inline_call(call, callee, names):
+    """Get the instructions that replace a call instruction with the
+    body of its callee. Fresh variable names and labels are drawn from
+    (and added to) the set `names`.
+    """
+    def rename(name):
+        new = fresh('{}.{}.'.format(callee['name'], name), names)
+        names.add(new)
+        return new
+
+    # Use the arguments in place of parameters that are never assigned.
+    params = callee.get('args', [])
+    assigned = {instr['dest'] for instr in callee['instrs'] if 'dest' in instr}
+    renamed = {}
+    out = []
+    for param, arg in zip(params, call.get('args', [])):
+        if param['name'] in assigned:
+            renamed[param['name']] = rename(param['name'])
+            out.append({'op': 'id', 'dest': renamed[param['name']],
+                        'type': param['type'], 'args': [arg]})
+        else:
+            renamed[param['name']] = arg
+
+    def var(name):
+        if name not in renamed:
+            renamed[name] = rename(name)
+        return renamed[name]
+
+    labels = {}
+
+    def label(name):
+        if name not in labels:
+            labels[name] = rename(name)
+        return labels[name]
+
+    after = None
+    body = callee['instrs']
+    last = max((i for i, instr in enumerate(body) if 'op' in instr),
+               default=-1)
+    for i, instr in enumerate(body):
+        if 'label' in instr:
+            out.append({'label': label(instr['label'])})
+            continue
+
+        if instr['op'] == 'ret':
+            if instr.get('args') and 'dest' in call:
+                out.append({'op': 'id', 'dest': call['dest'],
+                            'type': call['type'],
+                            'args': [var(instr['args'][0])]})
+            if i != last:
+                if after is None:
+                    after = fresh('{}.ret.'.format(callee['name']), names)
+                    names.add(after)
+                out.append({'op': 'jmp', 'labels': [after]})
+            continue
+
+        new = dict(instr)
+        if 'dest' in instr:
+            new['dest'] = var(instr['dest'])
+        if 'args' in instr:
+            new['args'] = [var(a) for a in instr['args']]
+        if 'labels' in instr:
+            new['labels'] = [label(lbl) for lbl in instr['labels']]
+        out.append(new)
+
+    if after is not None:
+        out.append({'label': after})
+    return out
+
+
+def can_inline(call, callee):
+    """Check whether a call to a (non-recursive) function can be
+    inlined at all.
+    """
+    if len(call.get('args', [])) != len(callee.get('args', [])):
+        return False
+    if 'dest' in call and 'type' not in callee:
+        return False
+    return not any(instr.get('op') == 'phi' for instr in callee['instrs'])
+
+
+def inline_func(func, funcs, recursive, counts=None):
+    """Inline the chosen calls in a function, given a map of all the
+    functions by name, the set of recursive function names, and,
+    optionally, the function's `Counts` from a profile. Return the
+    number of call sites inlined.
+    """
+    instrs = func['instrs']
+    if any(instr.get('op') == 'phi' for instr in instrs):
+        return 0
+
+    sites = {}
+    if counts is not None:
+        for name, block in block_map(form_blocks(instrs)).items():
+            for i, instr in enumerate(block):
+                sites[id(instr)] = name, i
+
+    # Find the candidate call sites, hottest first (if we have a
+    # profile) and then smallest first.
+    candidates = []
+    for pos, instr in enumerate(instrs):
+        if instr.get('op') != 'call' or not instr.get('funcs'):
+            continue
+        callee = funcs.get(instr['funcs'][0])
+        if callee is None or callee['name'] in recursive or \
+           not can_inline(instr, callee):
+            continue
+
+        cost = size(callee)
+        limit = MAX_CALLEE
+        calls = 0
+        if counts is not None:
+            calls = counts.calls[sites.get(id(instr))]
+            if not calls:
+                continue  # The call never ran.
+            if calls >= HOT_CALLS:
+                limit = MAX_HOT_CALLEE
+        if cost <= limit:
+            candidates.append((-calls, cost, pos))
+
+    # Take candidates until the function has grown too much.
+    start = size(func)
+    budget = max(start * GROWTH, start + MIN_BUDGET) - start
+    chosen = set()
+    for _, cost, pos in sorted(candidates):
+        if cost - 1 <= budget:
+            budget -= cost - 1
+            chosen.add(pos)
+    if not chosen:
+        return 0
+
+    names = {a['name'] for a in func.get('args', [])}
+    for instr in instrs:
+        names.update([instr.get('dest'), instr.get('label')])
+        names.update(instr.get('args', []))
+        names.update(instr.get('labels', []))
+
+    new = []
+    for pos, instr in enumerate(instrs):
+        if pos in chosen:
+            new += inline_call(instr, funcs[instr['funcs'][0]], names)
+        else:
+            new.append(instr)
+    func['instrs'] = new
+    return len(chosen)
+
+
+def inline(bril, profile=None):
+    """Inline calls throughout a program, optionally guided by a profile
+    (a map from function names to `Counts`).
+    """
+    funcs = {}
+    for func in bril['functions']:
+        funcs.setdefault(func['name'], []).append(func)
+    # Leave calls to ambiguous names alone.
+    funcs = {name: fs[0] for name, fs in funcs.items() if len(fs) == 1}
+
+    graph = call_graph(bril)
+    recursive = set()
+    for component in strongly_connected(graph):
+        if len(component) > 1 or component[0] in graph[component[0]]:
+            recursive.update(component)
+
+        # Callees come first, so they are done by the time we get here.
+        for name in component:
+            if name in funcs:
+                counts = None
+                if profile is not None:
+                    counts = profile.get(name)
+                    if counts is None:
+                        continue  # The function never ran.
+                inline_func(funcs[name], funcs, recursive, counts)
+    return bril
+
+
+if __name__ == '__main__':
+    profile = load_profile(sys.argv[1]) if len(sys.argv) > 1 else None
+    dump_json(inline(load_json(), profile))
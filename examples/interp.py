@@ -0,0 +1,850 @@
+"""A Bril interpreter in Python.
+
+This is a stand-in for `brili` that Python tools can call directly,
+covering the core, floating-point, memory, SSA, and speculation
+extensions. It takes the same arguments and produces the same output,
+including the `-p` dynamic instruction count and the run-time errors:
+
+    bril2json < prog.bril | python interp.py [-p] [ARGS...]
+
+Rather than walking the JSON for every instruction, the interpreter
+lowers each function once. Variables become integer slots in a register
+list, labels become direct references to the code they name, and every
+instruction becomes a closure (a "handler") over its slots. A function's
+code is a list of segments: straight-line runs of handlers that end at
+the next label or at an instruction that transfers control. The main
+loop then just runs a segment's handlers, adds its length to the
+instruction count, and dispatches on how it ends. Calls push a frame on
+an explicit stack, so deep recursion in the Bril program does not
+recurse in Python.
+
+The handlers trust the program to be well typed, so some type errors
+that `brili` reports (adding a bool to an int, for example) go
+unnoticed. All other run-time errors, and any handler that fails in
+Python, are reported with `brili`'s message.
+"""
+
+import math
+import operator
+import re
+import sys
+from collections import namedtuple, Counter
+from decimal import Decimal, Context, ROUND_HALF_UP
+
+from cfg import block_map
+from form_blocks import form_blocks
+from util import load_json, wrap_int, div_int
+
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+
+class BrilError(Exception):
+    """A run-time error in the interpreted program."""
+
+
+# A pointer into an allocation on the heap. `kind` is the Python type of
+# the values it points to (int, bool, float, or Pointer).
+Pointer = namedtuple('Pointer', ['base', 'offset', 'kind'])
+
+# The Python type for each Bril type; any pointer type maps to Pointer.
+KINDS = {'int': int, 'bool': bool, 'float': float}
+
+
+def kind_of(typ):
+    return Pointer if isinstance(typ, dict) else KINDS.get(typ)
+
+
+def type_name(typ):
+    """Format a type the way `brili` does in its error messages."""
+    return '[object Object]' if isinstance(typ, dict) else str(typ)
+
+
+# The number of arguments each operation takes, or None for any number.
+ARG_COUNTS = {
+    'add': 2, 'mul': 2, 'sub': 2, 'div': 2, 'id': 1,
+    'lt': 2, 'le': 2, 'gt': 2, 'ge': 2, 'eq': 2,
+    'not': 1, 'and': 2, 'or': 2,
+    'fadd': 2, 'fmul': 2, 'fsub': 2, 'fdiv': 2,
+    'flt': 2, 'fle': 2, 'fgt': 2, 'fge': 2, 'feq': 2,
+    'print': None, 'br': 1, 'jmp': 0, 'ret': None, 'nop': 0, 'call': None,
+    'alloc': 1, 'free': 1, 'store': 2, 'load': 1, 'ptradd': 2,
+    'phi': None, 'speculate': 0, 'guard': 1, 'commit': 0,
+}
+
+# The types that operations require of their arguments, for reporting
+# errors.
+ARG_TYPES = {
+    'add': 'int', 'mul': 'int', 'sub': 'int', 'div': 'int',
+    'lt': 'int', 'le': 'int', 'gt': 'int', 'ge': 'int', 'eq': 'int',
+    'not': 'bool', 'and': 'bool', 'or': 'bool',
+    'fadd': 'float', 'fmul': 'float', 'fsub': 'float', 'fdiv': 'float',
+    'flt': 'float', 'fle': 'float', 'fgt': 'float', 'fge': 'float',
+    'feq': 'float',
+    'br': 'bool', 'guard': 'bool', 'alloc': 'int',
+}
+
+
+def fdiv(a, b):
+    """Divide floats like JavaScript, where dividing by zero is no error.
+    """
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+WRAPPING_OPS = {
+    'add': operator.add,
+    'mul': operator.mul,
+    'sub': operator.sub,
+}
+
+BINARY_OPS = {
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'eq': operator.eq,
+    'and': operator.and_,
+    'or': operator.or_,
+    'fadd': operator.add,
+    'fmul': operator.mul,
+    'fsub': operator.sub,
+    'fdiv': fdiv,
+    'flt': operator.lt,
+    'fle': operator.le,
+    'fgt': operator.gt,
+    'fge': operator.ge,
+    'feq': operator.eq,
+}
+
+# Enough precision for `toFixed(17)` of any float below 1e21.
+FIXED = Context(prec=64, rounding=ROUND_HALF_UP)
+FIXED_EXP = Decimal('1e-17')
+
+
+def format_float(f):
+    """Format a float like JavaScript's `toFixed(17)`."""
+    if f != f:
+        return 'NaN'
+    if f in (math.inf, -math.inf):
+        return 'Infinity' if f > 0 else '-Infinity'
+    if abs(f) >= 1e21:
+        return repr(f)
+    return format(Decimal(f).quantize(FIXED_EXP, context=FIXED), 'f')
+
+
+FORMATS = {
+    int: str,
+    bool: lambda b: 'true' if b else 'false',
+    float: format_float,
+    Pointer: lambda p: '[object Object]',
+}
+
+# How a segment ends. Segments are lists of the form:
+#   [handlers, count, kind, a, b, c, instrs]
+# where `count` is the number of instructions the segment executes,
+# `instrs` are the instructions themselves (for error reporting), and
+# a, b, and c depend on the kind:
+# - JUMP: a is the next segment.
+# - BR: a is the condition's slot; b and c are the true and false segments.
+# - RET: a is the return value's slot, or None.
+# - CALL: a is the next segment, b is a `Call`.
+# - SPECULATE, COMMIT: a is the next segment.
+# - GUARD: a is the next segment, b is the condition's slot, and c is the
+#   segment to abort to.
+# - END: the function ends without a `ret`.
+# - ERROR: a is the message for an error to raise on reaching the segment.
+JUMP, BR, RET, CALL, SPECULATE, COMMIT, GUARD, END, ERROR = range(9)
+
+ENDERS = {'jmp': JUMP, 'br': BR, 'ret': RET, 'call': CALL,
+          'speculate': SPECULATE, 'commit': COMMIT, 'guard': GUARD}
+
+# A lowered call instruction:
+# - name: The callee's name.
+# - func: The callee's `Function`, or None if the name is not unique.
+# - args: The slots for the arguments.
+# - dest: The slot for the result, or None.
+# - type: The type of the result, or None.
+Call = namedtuple('Call', ['name', 'func', 'args', 'dest', 'type'])
+
+# A lowered function:
+# - name: The function's name.
+# - params: The slots for the parameters.
+# - kinds: The Python type of each parameter.
+# - type: The return type, or None.
+# - slots: A map from variable names to slots.
+# - entry: The first segment.
+Function = namedtuple('Function',
+                      ['name', 'params', 'kinds', 'type', 'slots', 'entry'])
+
+# Slots 0 and 1 in every register list hold the previous and current
+# label, for phi-nodes to find the edge they were reached along. When
+# profiling, slot 2 holds the name of the current basic block.
+LAST, CUR, BLOCK = 0, 1, 2
+RESERVED = 3
+
+# Execution counts for a function, when profiling:
+# - blocks: A Counter of block names.
+# - edges: A Counter of (source, destination) block name pairs.
+# - calls: A Counter of call sites, as (block name, index) pairs.
+# Blocks are named as in `cfg.block_map`, and the index of a call is its
+# position in its block.
+Counts = namedtuple('Counts', ['blocks', 'edges', 'calls'])
+
+
+def new_segment():
+    return [[], 0, END, None, None, None, []]
+
+
+class Heap:
+    """Allocations, keyed by a number that is never reused."""
+
+    def __init__(self):
+        self.storage = {}
+        self.count = 0
+
+    def alloc(self, amt, kind):
+        if amt <= 0:
+            raise BrilError('must allocate a positive amount of memory: '
+                            '{} <= 0'.format(amt))
+        base = self.count
+        self.count += 1
+        self.storage[base] = [None] * amt
+        return Pointer(base, 0, kind)
+
+    def free(self, ptr):
+        if ptr.offset == 0 and ptr.base in self.storage:
+            del self.storage[ptr.base]
+        else:
+            raise BrilError(
+                'Tried to free illegal memory location base: {}, offset: {}. '
+                'Offset must be 0.'.format(ptr.base, ptr.offset)
+            )
+
+    def data(self, ptr):
+        """Get the allocation that a pointer points into, checking that
+        the pointer is in bounds.
+        """
+        data = self.storage.get(ptr.base)
+        if data is None or not 0 <= ptr.offset < len(data):
+            raise BrilError(
+                'Uninitialized heap location {} and/or illegal offset {}'
+                .format(ptr.base, ptr.offset)
+            )
+        return data
+
+
+class Interpreter:
+    """Lower a Bril program and run it.
+
+    Printed values go to `out` (standard output by default). With
+    `profile`, the interpreter also counts how often every block, edge,
+    and call site executes, in a map from function names to `Counts`.
+    """
+
+    def __init__(self, bril, out=None, profile=False):
+        self.out = out or sys.stdout
+        self.heap = Heap()
+        self.profile = {} if profile else None
+
+        by_name = {}
+        for func in bril['functions']:
+            by_name.setdefault(func['name'], []).append(func)
+        self.by_name = by_name
+
+        # Lower every function. Calls refer to their callees' `Function`,
+        # so we fill in each one's segments after creating them all.
+        self.funcs = {name: self._function(funcs[0])
+                      for name, funcs in by_name.items() if len(funcs) == 1}
+        for name, lowered in self.funcs.items():
+            self._lower(by_name[name][0], lowered)
+
+    def find(self, name):
+        """Get a function by name, like `brili`'s `findFunc`."""
+        if name not in self.by_name:
+            raise BrilError('no function of name {} found'.format(name))
+        if name not in self.funcs:
+            raise BrilError('multiple functions of name {} found'.format(name))
+        return self.funcs[name]
+
+    def _function(self, func):
+        slots = {}
+        params = [slots.setdefault(a['name'], len(slots) + RESERVED)
+                  for a in func.get('args', [])]
+        return Function(
+            name=func['name'],
+            params=params,
+            kinds=[kind_of(a['type']) for a in func.get('args', [])],
+            type=func.get('type'),
+            slots=slots,
+            entry=new_segment(),
+        )
+
+    def _lower(self, func, lowered):
+        """Lower a function's instructions to segments, starting with the
+        (empty) entry segment of its `Function`.
+        """
+        slots = lowered.slots
+
+        def slot(var):
+            return slots.setdefault(var, len(slots) + RESERVED)
+
+        # Only phi-nodes care which label we came from, so we only keep
+        # track in functions that have them.
+        track = any(instr.get('op') == 'phi' for instr in func['instrs'])
+
+        # When profiling, find the block and index of every instruction.
+        if self.profile is not None:
+            counts = Counts(Counter(), Counter(), Counter())
+            self.profile[func['name']] = counts
+            sites = {}
+            for name, block in block_map(form_blocks(func['instrs'])).items():
+                for i, instr in enumerate(block):
+                    sites[id(instr)] = name, i
+
+        cur = lowered.entry
+        segments = {}
+        fixups = []  # (segment, index, label) for jump targets.
+        after_label = False
+
+        for instr in func['instrs']:
+            if 'label' in instr:
+                seg = new_segment()
+                if track:
+                    seg[0].append(self._enter(instr['label']))
+                if self.profile is not None:
+                    seg[0].append(self._count_block(instr['label'], counts))
+                if cur is not None:
+                    cur[2:4] = [JUMP, seg]
+                segments.setdefault(instr['label'], seg)
+                cur = seg
+                after_label = True
+                continue
+
+            if cur is None:
+                cur = new_segment()  # Unreachable code after a terminator.
+            # (A block whose label repeats an earlier one has no name.)
+            site = sites.get(id(instr)) if self.profile is not None else None
+            if site is not None:
+                if site[1] == 0 and not after_label:
+                    # The start of a block without a label.
+                    cur[0].append(self._count_block(site[0], counts))
+                if instr['op'] == 'call':
+                    cur[0].append(self._count_call(site, counts))
+            after_label = False
+            cur[1] += 1
+            cur[6].append(instr)
+
+            op = instr['op']
+            count = ARG_COUNTS.get(op, 0)
+            found = len(instr.get('args', []))
+            if op != 'const' and op not in ARG_COUNTS:
+                cur[0].append(self._fail('unknown opcode ' + op))
+                continue
+            if count is not None and found != count:
+                cur[0].append(self._fail(
+                    '{} takes {} argument(s); got {}'.format(op, count, found)
+                ))
+                continue
+            needed = {'jmp': 1, 'br': 2, 'guard': 1}.get(op, 0)
+            if 'labels' not in instr and needed:
+                cur[0].append(self._fail(
+                    'missing labels; expected at least {}'.format(needed)
+                ))
+                continue
+            if len(instr.get('labels', [])) < needed:
+                cur[0].append(self._fail(
+                    'expecting {} labels; found {}'.format(
+                        needed, len(instr['labels'])
+                    )
+                ))
+                continue
+
+            if op not in ENDERS:
+                handler = self._handler(instr, slot)
+                if handler is not None:
+                    cur[0].append(handler)
+                continue
+
+            kind = ENDERS[op]
+            args = [slot(a) for a in instr.get('args', [])]
+            labels = instr.get('labels', [])
+            cur[2] = kind
+            if kind == JUMP:
+                fixups.append((cur, 3, labels[0]))
+            elif kind == BR:
+                cur[3] = args[0]
+                fixups += [(cur, 4, labels[0]), (cur, 5, labels[1])]
+            elif kind == RET:
+                if len(args) > 1:
+                    cur[2:4] = [ERROR, 'ret takes 0 or 1 argument(s); '
+                                'got {}'.format(len(args))]
+                else:
+                    cur[3] = args[0] if args else None
+            elif kind == GUARD:
+                cur[4] = args[0]
+                fixups.append((cur, 5, labels[0]))
+            elif kind == CALL:
+                name = instr.get('funcs', [None])[0]
+                cur[4] = Call(
+                    name=name,
+                    func=self.funcs.get(name),
+                    args=args,
+                    dest=slot(instr['dest']) if 'dest' in instr else None,
+                    type=instr.get('type'),
+                )
+
+            if kind in (JUMP, BR, RET):
+                cur = None
+            else:
+                nxt = new_segment()
+                cur[3] = nxt
+                cur = nxt
+
+        for seg, index, label in fixups:
+            if label in segments:
+                seg[index] = segments[label]
+            else:
+                seg[index] = new_segment()
+                seg[index][2:4] = [ERROR, 'label {} not found'.format(label)]
+
+    def _enter(self, label):
+        """Make the handler for a label, which tracks the edge taken."""
+        def enter(regs):
+            regs[LAST] = regs[CUR]
+            regs[CUR] = label
+        return enter
+
+    def _count_block(self, name, counts):
+        """Make the profiling handler for entering a block."""
+        blocks, edges = counts.blocks, counts.edges
+
+        def count_block(regs):
+            if regs[BLOCK] is not None:
+                edges[regs[BLOCK], name] += 1
+            regs[BLOCK] = name
+            blocks[name] += 1
+        return count_block
+
+    def _count_call(self, site, counts):
+        """Make the profiling handler for a call site."""
+        calls = counts.calls
+
+        def count_call(regs):
+            calls[site] += 1
+        return count_call
+
+    def _fail(self, message):
+        """Make a handler that raises an error."""
+        def fail(regs):
+            raise BrilError(message)
+        return fail
+
+    def _handler(self, instr, slot):
+        """Make the handler for a non-terminator instruction, or return
+        None if it does nothing.
+        """
+        op = instr['op']
+        args = [slot(a) for a in instr.get('args', [])]
+        d = slot(instr['dest']) if 'dest' in instr else None
+        heap = self.heap
+
+        if op == 'const':
+            value = instr['value']
+            if instr['type'] == 'float':
+                value = float(value)
+            elif isinstance(value, (int, float)) and \
+                    not isinstance(value, bool):
+                value = math.floor(value)
+
+            def const(regs):
+                regs[d] = value
+            return const
+
+        if op == 'nop':
+            return None
+
+        if op in WRAPPING_OPS:
+            f = WRAPPING_OPS[op]
+            x, y = args
+
+            def wrapping(regs):
+                v = f(regs[x], regs[y])
+                if not INT_MIN <= v <= INT_MAX:
+                    v = wrap_int(v)
+                regs[d] = v
+            return wrapping
+
+        if op in BINARY_OPS:
+            f = BINARY_OPS[op]
+            x, y = args
+
+            def binary(regs):
+                regs[d] = f(regs[x], regs[y])
+            return binary
+
+        if op == 'id':
+            x, = args
+
+            def id_(regs):
+                v = regs[x]
+                if v is None:
+                    raise BrilError('undefined variable ' + instr['args'][0])
+                regs[d] = v
+            return id_
+
+        if op == 'not':
+            x, = args
+
+            def not_(regs):
+                regs[d] = regs[x] ^ True
+            return not_
+
+        if op == 'div':
+            x, y = args
+
+            def div(regs):
+                b = regs[y]
+                if b == 0:
+                    raise BrilError('division by zero')
+                regs[d] = div_int(regs[x], b)
+            return div
+
+        if op == 'print':
+            write = self.out.write
+
+            def print_(regs):
+                write(' '.join([FORMATS[type(regs[x])](regs[x])
+                                for x in args]) + '\n')
+            return print_
+
+        if op == 'alloc':
+            x, = args
+            typ = instr.get('type')
+            if not isinstance(typ, dict) or 'ptr' not in typ:
+                return self._fail('cannot allocate non-pointer type {}'
+                                  .format(type_name(typ)))
+            kind = kind_of(typ['ptr'])
+
+            def alloc(regs):
+                regs[d] = heap.alloc(regs[x], kind)
+            return alloc
+
+        if op == 'free':
+            x, = args
+
+            def free(regs):
+                heap.free(regs[x])
+            return free
+
+        if op == 'store':
+            x, y = args
+
+            def store(regs):
+                ptr = regs[x]
+                v = regs[y]
+                if type(v) is not ptr.kind:
+                    raise BrilError(store_error(instr, ptr, v))
+                heap.data(ptr)[ptr.offset] = v
+            return store
+
+        if op == 'load':
+            x, = args
+
+            def load(regs):
+                ptr = regs[x]
+                v = heap.data(ptr)[ptr.offset]
+                if v is None:
+                    raise BrilError('Pointer {} points to uninitialized data'
+                                    .format(instr['args'][0]))
+                regs[d] = v
+            return load
+
+        if op == 'ptradd':
+            x, y = args
+
+            def ptradd(regs):
+                ptr = regs[x]
+                regs[d] = Pointer(ptr.base, ptr.offset + regs[y], ptr.kind)
+            return ptradd
+
+        if op == 'phi':
+            labels = instr.get('labels', [])
+            if len(labels) != len(args):
+                return self._fail(
+                    'phi node has unequal numbers of labels and args'
+                )
+            sources = {}
+            for label, x in zip(labels, args):
+                sources.setdefault(label, x)
+
+            def phi(regs):
+                last = regs[LAST]
+                if last is None:
+                    raise BrilError('phi node executed with no last label')
+                x = sources.get(last)
+                regs[d] = None if x is None else regs[x]
+            return phi
+
+        raise AssertionError('unhandled opcode ' + op)
+
+    def run(self, args=()):
+        """Run the program's `main` function with a list of string
+        arguments. Return the number of instructions executed.
+        """
+        main = self.find('main')
+        regs = [None] * (len(main.slots) + RESERVED)
+        for slot, value in zip(main.params, parse_main_args(
+                self.by_name['main'][0].get('args', []), args)):
+            regs[slot] = value
+
+        count = self._execute(main, regs)
+        if self.heap.storage:
+            raise BrilError('Some memory locations have not been freed by '
+                            'end of execution.')
+        return count
+
+    def _execute(self, func, regs):
+        """The main loop."""
+        frames = []  # (func, regs, segment, call, spec) for each caller.
+        spec = None  # (regs, spec) for each enclosing speculation.
+        count = 0
+        seg = func.entry
+
+        try:
+            while True:
+                handlers, n, kind, a, b, c, _ = seg
+                count += n
+                for handler in handlers:
+                    handler(regs)
+
+                if kind == JUMP:
+                    seg = a
+                    continue
+
+                if kind == BR:
+                    cond = regs[a]
+                    if cond is True:
+                        seg = b
+                    elif cond is False:
+                        seg = c
+                    else:
+                        raise TypeError()
+                    continue
+
+                if kind == CALL:
+                    if spec is not None:
+                        raise BrilError('call not allowed during speculation')
+                    callee = b.func or self.find(b.name)
+                    if len(b.args) != len(callee.params):
+                        raise BrilError(
+                            'function expected {} arguments, got {}'
+                            .format(len(callee.params), len(b.args))
+                        )
+                    new = [None] * (len(callee.slots) + RESERVED)
+                    for x, p, k in zip(b.args, callee.params, callee.kinds):
+                        v = regs[x]
+                        if v is None:
+                            raise TypeError()
+                        if type(v) is not k:
+                            raise BrilError('function argument type mismatch')
+                        new[p] = v
+                    frames.append((func, regs, a, b, spec))
+                    func, regs, seg, spec = callee, new, callee.entry, None
+                    continue
+
+                if kind == RET or kind == END:
+                    if spec is not None:
+                        raise BrilError(
+                            'ret not allowed during speculation' if kind == RET
+                            else 'implicit return in speculative state'
+                        )
+                    value = None
+                    if kind == RET and a is not None:
+                        value = regs[a]
+                        if value is None:
+                            raise TypeError()
+                    if not frames:
+                        return count
+                    callee = func
+                    func, regs, seg, call, spec = frames.pop()
+                    check_return(call, callee, value)
+                    if call.dest is not None:
+                        regs[call.dest] = value
+                    continue
+
+                if kind == GUARD:
+                    cond = regs[b]
+                    if cond is True:
+                        seg = a
+                    elif cond is False:
+                        if spec is None:
+                            raise BrilError(
+                                'abort in non-speculative state'
+                            )
+                        block = regs[BLOCK]
+                        regs, spec = spec
+                        regs[BLOCK] = block
+                        seg = c
+                    else:
+                        raise TypeError()
+                    continue
+
+                if kind == SPECULATE:
+                    spec = (regs, spec)
+                    regs = list(regs)
+                    seg = a
+                    continue
+
+                if kind == COMMIT:
+                    if spec is None:
+                        raise BrilError('commit in non-speculative state')
+                    spec = None
+                    seg = a
+                    continue
+
+                if kind == ERROR:
+                    raise BrilError(a)
+
+        except BrilError:
+            raise
+        except Exception as exc:
+            # A handler failed in Python: find the first instruction in
+            # the segment with a bad argument, and report that.
+            error = diagnose(seg[6], func.slots, regs)
+            if error is None:
+                raise
+            raise error from exc
+
+
+def diagnose(instrs, slots, regs):
+    """Find the error that `brili` would report for a list of
+    instructions, given the current values of the variables. Return a
+    BrilError, or None if all the arguments look fine.
+    """
+    for instr in instrs:
+        op = instr['op']
+        for i, arg in enumerate(instr.get('args', [])):
+            value = regs[slots[arg]]
+            if value is None:
+                if op == 'phi':
+                    continue
+                return BrilError('undefined variable ' + arg)
+            typ = ARG_TYPES.get(op)
+            if op == 'ptradd':
+                typ = 'int' if i == 1 else None
+            if typ and i < (1 if op in ('br', 'guard') else 2) and \
+               type(value) is not KINDS[typ]:
+                return BrilError('{} argument {} must be a {}'
+                                 .format(op, i, typ))
+            if op in ('free', 'load', 'store', 'ptradd') and i == 0 and \
+               type(value) is not Pointer:
+                return BrilError('{} argument 0 must be a Pointer'
+                                 .format(op))
+    return None
+
+
+def store_error(instr, ptr, value):
+    """Get the message for storing a value of the wrong type."""
+    if value is None:
+        return 'undefined variable ' + instr['args'][1]
+    names = {int: 'int', bool: 'bool', float: 'float',
+             Pointer: '[object Object]'}
+    return 'store argument 1 must be a {}'.format(names[ptr.kind])
+
+
+def check_return(call, callee, value):
+    """Check the value a function returned against the call's
+    destination and the function's declared type.
+    """
+    if call.dest is None:
+        if value is not None:
+            raise BrilError('unexpected value returned without destination')
+        if callee.type is not None:
+            raise BrilError("non-void function (type: {}) doesn't return "
+                            "anything".format(type_name(callee.type)))
+        return
+    if call.type is None:
+        raise BrilError('function call must include a type if it has a '
+                        'destination')
+    if value is None:
+        raise BrilError("non-void function (type: {}) doesn't return "
+                        "anything".format(type_name(callee.type)))
+    if type(value) is not kind_of(call.type):
+        raise BrilError('type of value returned by function does not match '
+                        'destination type')
+    if callee.type is None:
+        raise BrilError('function with void return type used in value call')
+    if not same_type(call.type, callee.type):
+        raise BrilError('type of value returned by function does not match '
+                        'declaration')
+
+
+def same_type(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return same_type(a['ptr'], b['ptr'])
+    return a == b
+
+
+INT_PREFIX = re.compile(r'\s*[+-]?\d+')
+FLOAT_PREFIX = re.compile(
+    r'\s*[+-]?(Infinity|(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?)'
+)
+
+
+def parse_main_args(params, args):
+    """Parse the command-line arguments to `main`, like `brili`."""
+    if len(args) != len(params):
+        raise BrilError(
+            'mismatched main argument arity: expected {}; got {}'
+            .format(len(params), len(args))
+        )
+    values = []
+    for param, arg in zip(params, args):
+        typ = param['type']
+        if typ == 'int':
+            # Like `BigInt(parseInt(arg))`, which goes through a double.
+            match = INT_PREFIX.match(arg)
+            if not match:
+                raise BrilError('int argument to main must be an integer; '
+                                'got {}'.format(arg))
+            values.append(int(float(match.group())))
+        elif typ == 'float':
+            match = FLOAT_PREFIX.match(arg)
+            if not match:
+                raise BrilError("float argument to main must not be 'NaN'; "
+                                "got {}".format(arg))
+            values.append(float(match.group().replace('Infinity', 'inf')))
+        elif typ == 'bool':
+            if arg not in ('true', 'false'):
+                raise BrilError("boolean argument to main must be "
+                                "'true'/'false'; got {}".format(arg))
+            values.append(arg == 'true')
+        else:
+            values.append(None)
+    return values
+
+
+def main():
+    args = sys.argv[1:]
+    profiling = '-p' in args
+    if profiling:
+        args.remove('-p')
+
+    try:
+        count = Interpreter(load_json()).run(args)
+    except BrilError as exc:
+        sys.stdout.flush()
+        print('error: {}'.format(exc), file=sys.stderr)
+        sys.exit(2)
+
+    if profiling:
+        print('total_dyn_inst: {}'.format(count), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
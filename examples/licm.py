@@ -0,0 +1,145 @@
+"""Loop-invariant code motion for Bril programs.
+
+    bril2json < prog.bril | python licm.py | python tdce.py
+
+An instruction in a loop is invariant if it computes the same value on
+every iteration: it is a pure operation whose arguments are all defined
+outside the loop (or by other invariant instructions). We move every
+invariant instruction to the loop's preheader, working from the
+innermost loops outward, so an instruction can move out of several
+loops at once.
+
+Only operations that can never fail are moved, because the preheader
+runs even when the loop body does not. That rules out memory operations
+(which also depend on the stores, calls, and frees in the loop) and
+divisions, except by a nonzero constant. The pass works on SSA form and
+on ordinary programs alike: an instruction only moves if it is the sole
+assignment to its variable in the function, and if its arguments are
+sure to be defined at the preheader.
+"""
+
+from collections import Counter
+
+from cfg import CFG, reassemble, drop_fallthroughs
+from gvn import PURE_OPS
+from loops import natural_loops, preheader, add_preheaders
+from util import load_json, dump_json
+
+# Pure operations that can fail at run time, with a check that a
+# constant last argument keeps them from failing.
+TRAPPING_OPS = {
+    'div': lambda n: n != 0,
+    'int2char': lambda n: 0 <= n <= 0x10ffff and not 0xd800 <= n <= 0xdfff,
+}
+
+
+def invariant_code(blocks, body, single, consts, available):
+    """Find the invariant instructions in a loop, given its blocks (in
+    reverse postorder), the set of variables assigned exactly once in
+    the function, the values of those that are constants, and a
+    predicate that checks whether a variable defined outside the loop is
+    sure to be defined at the preheader. Produce
+    (block name, instruction) pairs in an order where definitions come
+    before their uses.
+    """
+    defined = {instr['dest'] for name in body for instr in blocks[name]
+               if 'dest' in instr}
+    invariant = {}
+    found = []
+    changed = True
+    while changed:
+        changed = False
+        for name in body:
+            for instr in blocks[name]:
+                dest = instr.get('dest')
+                if dest is None or dest in invariant or dest not in single:
+                    continue
+                op = instr['op']
+                if op != 'const' and op not in PURE_OPS:
+                    continue
+                args = instr.get('args', [])
+                if op in TRAPPING_OPS and not (
+                    args[-1] in consts and TRAPPING_OPS[op](consts[args[-1]])
+                ):
+                    continue
+                if all(a in invariant or
+                       (a not in defined and available(a)) for a in args):
+                    invariant[dest] = instr
+                    found.append((name, instr))
+                    changed = True
+    return found
+
+
+def licm_func(func, cfg=None):
+    """Hoist loop-invariant code in a function, optionally reusing a
+    `CFG` that was already built for it. Adding preheaders changes
+    control flow, so the CFG is stale afterward.
+    """
+    original = [dict(instr) for instr in func['instrs']]
+    if cfg is None:
+        cfg = CFG(func)
+    if add_preheaders(func, cfg):
+        cfg = CFG(func)
+    loops = natural_loops(cfg)
+
+    blocks = cfg.blocks(func)
+    params = {a['name'] for a in func.get('args', [])}
+    counts = Counter(instr['dest'] for instr in func['instrs']
+                     if 'dest' in instr)
+    counts.update(params)
+    single = {var for var, n in counts.items() if n == 1}
+    consts = {instr['dest']: instr['value'] for instr in func['instrs']
+              if instr.get('op') == 'const' and instr['dest'] in single}
+
+    # The blocks where every variable is assigned.
+    def_blocks = {}
+    for name, block in blocks.items():
+        for instr in block:
+            if 'dest' in instr:
+                def_blocks.setdefault(instr['dest'], set()).add(cfg.ids[name])
+
+    order = {b: i for i, b in enumerate(cfg.rpo)}
+    changed = False
+    for loop in loops:
+        body = [cfg.names[b] for b in sorted(loop.body, key=order.get)]
+        pre = preheader(cfg, loop)
+        if pre is None:
+            continue  # Unreachable.
+
+        def available(var):
+            # Some assignment must dominate the preheader. (In SSA form,
+            # the one assignment to a variable used in the loop always
+            # does.)
+            return var in params or any(cfg.dominates(b, pre)
+                                        for b in def_blocks.get(var, ()))
+
+        hoisted = invariant_code(blocks, body, single, consts, available)
+        if not hoisted:
+            continue
+        changed = True
+
+        moved = {id(instr) for _, instr in hoisted}
+        for name in body:
+            blocks[name] = [i for i in blocks[name] if id(i) not in moved]
+        pre_block = blocks[cfg.names[pre]]
+        pre_block[-1:-1] = [instr for _, instr in hoisted]
+        for _, instr in hoisted:
+            def_blocks[instr['dest']] = {pre}
+
+    if changed:
+        func['instrs'] = reassemble(blocks)
+        drop_fallthroughs(func)
+    else:
+        # Leave the function as it was, without preheaders or the
+        # terminators that building the CFG added.
+        func['instrs'] = original
+
+
+def licm(bril):
+    for func in bril['functions']:
+        licm_func(func)
+    return bril
+
+
+if __name__ == '__main__':
+    dump_json(licm(load_json()))
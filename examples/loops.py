@@ -0,0 +1,159 @@
+"""Find the natural loops in Bril functions.
+
+A back edge is a CFG edge whose target dominates its source. The natural
+loop of a back edge consists of its target (the loop's header) and every
+block that can reach the source without passing through the header.
+Loops that share a header are merged into one.
+
+    bril2json < prog.bril | python loops.py
+
+prints every loop's header, body, and exits.
+"""
+
+from collections import OrderedDict, namedtuple
+
+from cfg import CFG, reassemble
+from util import fresh, load_json
+
+# A natural loop, in terms of block ids:
+# - header: The block that every entry into the loop goes through.
+# - body: The set of blocks in the loop, including the header.
+# - latches: The sources of the loop's back edges.
+Loop = namedtuple('Loop', ['header', 'body', 'latches'])
+
+
+def back_edges(cfg):
+    """Find the back edges in a CFG, as (source, target) pairs."""
+    reachable = set(cfg.rpo)
+    return [(a, b) for a in cfg.rpo for b in cfg.succs[a]
+            if b in reachable and cfg.dominates(b, a)]
+
+
+def natural_loops(cfg):
+    """Find the natural loops in a CFG, innermost loops first.
+
+    Since inner loops are smaller than the loops that contain them,
+    sorting by size puts every loop before any loop containing it.
+    """
+    latches = OrderedDict()
+    for a, b in back_edges(cfg):
+        latches.setdefault(b, []).append(a)
+
+    loops = []
+    for header, tails in latches.items():
+        body = {header}
+        work = [t for t in tails if t != header]
+        body.update(work)
+        while work:
+            node = work.pop()
+            for p in cfg.preds[node]:
+                if p not in body:
+                    body.add(p)
+                    work.append(p)
+        loops.append(Loop(header, body, tails))
+
+    loops.sort(key=lambda loop: len(loop.body))
+    return loops
+
+
+def exits(cfg, loop):
+    """Find the blocks in a loop with a successor outside of it."""
+    return [b for b in loop.body
+            if any(s not in loop.body for s in cfg.succs[b])]
+
+
+def preheader(cfg, loop):
+    """Get the loop's preheader: its header's only predecessor from
+    outside the loop, if that block has no other successor. Otherwise,
+    return None.
+    """
+    outside = [p for p in cfg.preds[loop.header] if p not in loop.body]
+    if len(outside) == 1 and len(cfg.succs[outside[0]]) == 1:
+        return outside[0]
+    return None
+
+
+def add_preheaders(func, cfg):
+    """Give every natural loop in a function a preheader. Return True if
+    we had to add any blocks, which leaves the CFG stale.
+
+    A new preheader jumps to the loop's header, and every edge into the
+    header from outside the loop goes to the preheader instead. If the
+    header has phi-nodes, their arguments from outside the loop move to
+    new phi-nodes in the preheader (or, if only one predecessor enters
+    the loop, just get relabeled).
+    """
+    blocks = cfg.blocks(func)
+    variables = {instr['dest'] for instr in func['instrs'] if 'dest' in instr}
+    new = {}  # Header name to preheader name.
+    for loop in natural_loops(cfg):
+        if preheader(cfg, loop) is not None:
+            continue
+        header = cfg.names[loop.header]
+        outside = {cfg.names[p] for p in cfg.preds[loop.header]
+                   if p not in loop.body}
+        if not outside or header in new:
+            continue  # Unreachable.
+
+        pre = fresh(header + '.pre', set(blocks) | set(new.values()))
+        new[header] = pre
+        pre_block = []
+
+        for pred in outside:
+            term = blocks[pred][-1]
+            term['labels'] = [pre if lbl == header else lbl
+                              for lbl in term['labels']]
+
+        for instr in blocks[header]:
+            if instr.get('op') != 'phi':
+                continue
+            pairs = list(zip(instr['labels'], instr['args']))
+            entering = [(lbl, arg) for lbl, arg in pairs if lbl in outside]
+            pairs = [(lbl, arg) for lbl, arg in pairs if lbl not in outside]
+            if len(entering) == 1 and len(outside) == 1:
+                pairs.insert(0, (pre, entering[0][1]))
+            elif entering:
+                arg = fresh(instr['dest'] + '.pre', variables)
+                variables.add(arg)
+                pre_block.append({
+                    'op': 'phi', 'dest': arg, 'type': instr['type'],
+                    'labels': [lbl for lbl, _ in entering],
+                    'args': [a for _, a in entering],
+                })
+                pairs.insert(0, (pre, arg))
+            instr['labels'] = [lbl for lbl, _ in pairs]
+            instr['args'] = [arg for _, arg in pairs]
+
+        pre_block.append({'op': 'jmp', 'labels': [header]})
+        blocks[pre] = pre_block
+
+    if not new:
+        return False
+
+    # Lay out each preheader just before its header.
+    order = []
+    pres = set(new.values())
+    for name in blocks:
+        if name in pres:
+            continue
+        if name in new:
+            order.append(new[name])
+        order.append(name)
+    func['instrs'] = reassemble(OrderedDict((n, blocks[n]) for n in order))
+    return True
+
+
+def print_loops(bril):
+    for func in bril['functions']:
+        cfg = CFG(func)
+        print('{}:'.format(func['name']))
+        for loop in natural_loops(cfg):
+            print('  {}: {}; exits: {}'.format(
+                cfg.names[loop.header],
+                ' '.join(sorted(cfg.names[b] for b in loop.body)),
+                ' '.join(sorted(cfg.names[b] for b in exits(cfg, loop))),
+            ))
+
+
+if __name__ == '__main__':
+    print_loops(load_json())
@@ -1,11 +1,10 @@
 """Local value numbering for Bril.
 """
-import json
 import sys
 from collections import namedtuple
 
 from form_blocks import form_blocks
-from util import flatten
+from util import flatten, load_json, dump_json, wrap_int, div_int
 
 # A Value uniquely represents a computation in terms of sub-values.
 Value = namedtuple('Value', ['op', 'args'])
@@ -189,10 +188,10 @@ def _lookup(value2num, value):
 
 
 FOLDABLE_OPS = {
-    'add': lambda a, b: a + b,
-    'mul': lambda a, b: a * b,
-    'sub': lambda a, b: a - b,
-    'div': lambda a, b: a // b,
+    'add': lambda a, b: wrap_int(a + b),
+    'mul': lambda a, b: wrap_int(a * b),
+    'sub': lambda a, b: wrap_int(a - b),
+    'div': div_int,
     'gt': lambda a, b: a > b,
     'lt': lambda a, b: a < b,
     'ge': lambda a, b: a >= b,
@@ -246,23 +245,30 @@ def _canonicalize(value):
         return value
 
 
+def lvn_func(func, prop=False, canon=False, fold=False):
+    """Apply the local value numbering optimization to every basic block
+    in a function.
+    """
+    blocks = list(form_blocks(func['instrs']))
+    for block in blocks:
+        lvn_block(
+            block,
+            lookup=_lookup if prop else lambda v2n, v: v2n.get(v),
+            canonicalize=_canonicalize if canon else lambda v: v,
+            fold=_fold if fold else lambda n2c, v: None,
+        )
+    func['instrs'] = flatten(blocks)
+
+
 def lvn(bril, prop=False, canon=False, fold=False):
     """Apply the local value numbering optimization to every basic block
     in every function.
     """
     for func in bril['functions']:
-        blocks = list(form_blocks(func['instrs']))
-        for block in blocks:
-            lvn_block(
-                block,
-                lookup=_lookup if prop else lambda v2n, v: v2n.get(v),
-                canonicalize=_canonicalize if canon else lambda v: v,
-                fold=_fold if fold else lambda n2c, v: None,
-            )
-        func['instrs'] = flatten(blocks)
+        lvn_func(func, prop, canon, fold)
 
 
 if __name__ == '__main__':
-    bril = json.load(sys.stdin)
+    bril = load_json()
     lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv)
-    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+    dump_json(bril)
@@ -0,0 +1,121 @@
+"""Run a pipeline of passes over a Bril program in a single process.
+
+Chaining passes with shell pipes re-serializes and re-parses the whole
+program at every stage. This pass manager instead loads the program
+once, runs each named pass in memory, and emits the result at the end:
+
+    bril2json < prog.bril | python passes.py to_ssa lvn tdce+ from_ssa
+
+With `-t`, report the wall-clock time spent in every pass, per function
+and in total, on standard error.
+"""
+
+import sys
+import time
+from collections import namedtuple
+from functools import partial
+
+from adce import adce_func
+from cfg import CFG
+from licm import licm_func
+from lvn import lvn_func
+from tdce import trivial_dce, trivial_dce_plus, drop_killed_pass
+from to_ssa import func_to_ssa
+from unroll import unroll_func
+from from_ssa import func_from_ssa, func_from_ssa_naive
+from gvn import gvn_func
+from indvars import strength_reduce_func
+from sccp import func_sccp
+from util import load_json, dump_json
+
+# A pass transforms a single function in place. It consists of:
+# - run: The function to run.
+# - uses_cfg: True if `run` takes the function's `CFG` as a second
+#   argument.
+# - preserves_cfg: False if the pass changes control flow, which
+#   invalidates any CFG built for the function so far.
+Pass = namedtuple('Pass', ['run', 'uses_cfg', 'preserves_cfg'])
+
+PASSES = {
+    'lvn': Pass(partial(lvn_func, prop=True, canon=True, fold=True),
+                uses_cfg=False, preserves_cfg=True),
+    'tdce': Pass(trivial_dce, uses_cfg=False, preserves_cfg=True),
+    'tdce+': Pass(trivial_dce_plus, uses_cfg=False, preserves_cfg=True),
+    'dkp': Pass(drop_killed_pass, uses_cfg=False, preserves_cfg=True),
+    'to_ssa': Pass(func_to_ssa, uses_cfg=True, preserves_cfg=True),
+    'to_ssa_semi': Pass(partial(func_to_ssa, mode='semi'),
+                        uses_cfg=True, preserves_cfg=True),
+    'to_ssa_pruned': Pass(partial(func_to_ssa, mode='pruned'),
+                          uses_cfg=True, preserves_cfg=True),
+    'from_ssa': Pass(func_from_ssa, uses_cfg=True, preserves_cfg=False),
+    'from_ssa_naive': Pass(func_from_ssa_naive, uses_cfg=True,
+                           preserves_cfg=True),
+    'sccp': Pass(func_sccp, uses_cfg=True, preserves_cfg=False),
+    'gvn': Pass(gvn_func, uses_cfg=True, preserves_cfg=True),
+    'adce': Pass(adce_func, uses_cfg=True, preserves_cfg=False),
+    'licm': Pass(licm_func, uses_cfg=False, preserves_cfg=False),
+    'sr': Pass(strength_reduce_func, uses_cfg=False, preserves_cfg=False),
+    'unroll': Pass(unroll_func, uses_cfg=False, preserves_cfg=False),
+}
+
+
+def run_passes(bril, names, times=None):
+    """Run the named passes, in order, on every function in a program.
+
+    Each function's CFG is built on demand and shared by consecutive
+    passes until one of them changes control flow. If `times` is a list,
+    append a (pass, function, seconds) tuple to it for every pass
+    execution.
+    """
+    cfgs = {}
+    for name in names:
+        pass_ = PASSES[name]
+        for func in bril['functions']:
+            start = time.perf_counter()
+            if pass_.uses_cfg:
+                if func['name'] not in cfgs:
+                    cfgs[func['name']] = CFG(func)
+                pass_.run(func, cfgs[func['name']])
+            else:
+                pass_.run(func)
+            if not pass_.preserves_cfg:
+                cfgs.pop(func['name'], None)
+            if times is not None:
+                times.append((name, func['name'],
+                              time.perf_counter() - start))
+    return bril
+
+
+def report(times, file=None):
+    """Print a table of pass execution times in milliseconds.
+    """
+    file = file or sys.stderr
+    totals = {}
+    for name, func, secs in times:
+        print('{:<10} {:<24} {:>10.3f}'.format(name, func, secs * 1000),
+              file=file)
+        totals[name] = totals.get(name, 0.0) + secs
+    for name, secs in totals.items():
+        print('{:<10} {:<24} {:>10.3f}'.format(name, '(total)', secs * 1000),
+              file=file)
+
+
+def main():
+    args = sys.argv[1:]
+    timing = '-t' in args
+    names = [a for a in args if a != '-t']
+    for name in names:
+        if name not in PASSES:
+            sys.exit('unknown pass {}; choose from: {}'.format(
+                name, ', '.join(PASSES),
+            ))
+
+    times = [] if timing else None
+    bril = run_passes(load_json(), names, times)
+    dump_json(bril)
+    if timing:
+        report(times)
+
+
+if __name__ == '__main__':
+    main()
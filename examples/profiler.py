@@ -0,0 +1,94 @@
+"""Profile how often the blocks, edges, and call sites of a Bril
+program execute.
+
+    bril2json < prog.bril | python profiler.py [ARGS...] > prog.prof.json
+
+This runs the program, with the given arguments, in the Python
+interpreter (`interp.py`) and emits the counts as JSON. The program's
+own output goes to standard error. For every function that ran, the
+profile has the number of times each block executed, each edge was
+taken, and each call site called, keyed by the block names that
+`cfg.block_map` gives the function:
+
+    {"main": {"blocks": {"b1": 1, "loop": 11, "body": 10, "done": 1},
+              "edges": {"b1": {"loop": 1},
+                        "loop": {"body": 10, "done": 1},
+                        "body": {"loop": 10}},
+              "calls": {"body": {"2": 10}}}}
+
+A call site is the index of the `call` in its block (not counting the
+label). Anything that never executed is left out. Passes that want to
+use a profile can read it with `load_profile`.
+"""
+
+import json
+import sys
+from collections import Counter
+
+from interp import Interpreter, BrilError, Counts
+from util import load_json
+
+
+def profile(bril, args=(), out=None):
+    """Run a program with a list of string arguments, printing to `out`.
+    Return a map from function names to their `Counts`.
+    """
+    interp = Interpreter(bril, out=out, profile=True)
+    interp.run(args)
+    return {name: counts for name, counts in interp.profile.items()
+            if counts.blocks}
+
+
+def to_json(prof):
+    """Convert a profile to its JSON form."""
+    data = {}
+    for name, counts in prof.items():
+        edges = {}
+        for (src, dest), n in counts.edges.items():
+            edges.setdefault(src, {})[dest] = n
+        calls = {}
+        for (block, index), n in counts.calls.items():
+            calls.setdefault(block, {})[str(index)] = n
+        data[name] = {
+            'blocks': dict(counts.blocks),
+            'edges': edges,
+            'calls': calls,
+        }
+    return data
+
+
+def from_json(data):
+    """Convert a profile from its JSON form."""
+    prof = {}
+    for name, func in data.items():
+        prof[name] = Counts(
+            blocks=Counter(func.get('blocks', {})),
+            edges=Counter({(src, dest): n
+                           for src, dests in func.get('edges', {}).items()
+                           for dest, n in dests.items()}),
+            calls=Counter({(block, int(index)): n
+                           for block, sites in func.get('calls', {}).items()
+                           for index, n in sites.items()}),
+        )
+    return prof
+
+
+def load_profile(path):
+    """Read a profile from a JSON file. Functions, blocks, edges, and
+    call sites that are missing from the profile count as zero.
+    """
+    with open(path) as f:
+        return from_json(json.load(f))
+
+
+def main():
+    try:
+        prof = profile(load_json(), sys.argv[1:], out=sys.stderr)
+    except BrilError as exc:
+        print('error: {}'.format(exc), file=sys.stderr)
+        sys.exit(2)
+    print(json.dumps(to_json(prof), indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Sparse conditional constant propagation (Wegman and Zadeck).
+
+The input must be in SSA form, as produced by `to_ssa.py`. The analysis
+follows def-use chains instead of copying environments block by block,
+and only considers control-flow edges that can execute given the
+constants found so far. The pass then replaces constant definitions with
+`const` instructions, turns branches on constants into jumps, and
+deletes blocks that can never execute:
+
+    bril2json < prog.bril | python to_ssa.py | python sccp.py
+"""
+
+from collections import defaultdict
+
+from cfg import CFG, reassemble
+from util import load_json, dump_json, wrap_int, div_int
+
+# Lattice values: a variable is TOP until we find a definition that can
+# execute, then a constant, or BOTTOM once it might hold two different
+# values. Constants are plain Python ints and bools.
+TOP = object()
+BOTTOM = object()
+
+# The placeholder `to_ssa.py` uses for phi arguments along paths where the
+# variable is not defined.
+UNDEFINED = '__undefined'
+
+
+FOLDABLE_OPS = {
+    'id': lambda a: a,
+    'add': lambda a, b: wrap_int(a + b),
+    'mul': lambda a, b: wrap_int(a * b),
+    'sub': lambda a, b: wrap_int(a - b),
+    'div': div_int,
+    'eq': lambda a, b: a == b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+    'not': lambda a: not a,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+}
+
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP:
+        return a
+    if a is BOTTOM or b is BOTTOM or a != b:
+        return BOTTOM
+    return a
+
+
+def evaluate(instr, values):
+    """Compute the lattice value of a non-phi instruction's destination.
+    """
+    op = instr['op']
+    if op == 'const':
+        if instr['type'] in ('int', 'bool'):
+            return instr['value']
+        return BOTTOM
+    if op not in FOLDABLE_OPS:
+        return BOTTOM  # Calls, memory, floats, etc.
+
+    args = [values.get(a, TOP) for a in instr['args']]
+
+    # Short-circuit `and false` and `or true`, whatever the other side.
+    if op in ('and', 'or'):
+        for a in args:
+            if a is not TOP and a is not BOTTOM and bool(a) == (op == 'or'):
+                return a
+
+    if any(a is BOTTOM for a in args):
+        return BOTTOM
+    if any(a is TOP for a in args):
+        return TOP
+    if op == 'div' and args[1] == 0:
+        return BOTTOM  # Leave the division error to run time.
+    return FOLDABLE_OPS[op](*args)
+
+
+def sccp_analyze(blocks, args):
+    """Find the constant variables and executable edges of an SSA
+    function.
+
+    Produce a map from variable names to lattice values (missing
+    variables are TOP) and a map from each executable block's name to the
+    set of predecessors it can be reached from. (The entry's set is
+    empty.)
+    """
+    # Def-use chains: where each variable is used.
+    uses = defaultdict(list)
+    for name, block in blocks.items():
+        for instr in block:
+            for arg in instr.get('args', ()):
+                uses[arg].append((name, instr))
+
+    values = {arg: BOTTOM for arg in args}
+    values[UNDEFINED] = BOTTOM
+    exec_preds = {}
+
+    entry = next(iter(blocks))
+    flow_work = [(None, entry)]
+    ssa_work = []
+
+    def visit(name, instr):
+        dest = instr.get('dest')
+        if dest is None:
+            op = instr['op']
+            if op == 'br':
+                cond = values.get(instr['args'][0], TOP)
+                if cond is BOTTOM:
+                    for target in instr['labels']:
+                        flow_work.append((name, target))
+                elif cond is not TOP:
+                    flow_work.append((name, instr['labels'][0 if cond else 1]))
+            elif op == 'jmp':
+                flow_work.append((name, instr['labels'][0]))
+            return
+
+        # Skip values that nobody reads (as with many phi-nodes in
+        # minimal SSA) and values that are already as low as they go.
+        old = values.get(dest, TOP)
+        if old is BOTTOM or dest not in uses:
+            return
+
+        if instr['op'] == 'phi':
+            val = TOP
+            preds = exec_preds[name]
+            for label, arg in zip(instr['labels'], instr['args']):
+                if label in preds:
+                    val = meet(val, values.get(arg, TOP))
+        else:
+            val = evaluate(instr, values)
+
+        # Values only ever move down the lattice.
+        if val is not old and (old is TOP or val is BOTTOM):
+            values[dest] = val
+            ssa_work.append(dest)
+
+    while flow_work or ssa_work:
+        while flow_work:
+            pred, name = flow_work.pop()
+            if name not in exec_preds:
+                exec_preds[name] = set() if pred is None else {pred}
+                for instr in blocks[name]:
+                    visit(name, instr)
+            elif pred not in exec_preds[name]:
+                # Only the phi-nodes can change along a new edge.
+                exec_preds[name].add(pred)
+                for instr in blocks[name]:
+                    if instr.get('op') == 'phi':
+                        visit(name, instr)
+
+        while ssa_work:
+            var = ssa_work.pop()
+            for name, instr in uses[var]:
+                if name in exec_preds:
+                    visit(name, instr)
+
+    return values, exec_preds
+
+
+def func_sccp(func, cfg=None):
+    """Run SCCP on an SSA function, optionally reusing a `CFG` that was
+    already built for it. The pass changes control flow, so the CFG is
+    stale afterward.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
+    args = [a['name'] for a in func.get('args', [])]
+    values, exec_preds = sccp_analyze(blocks, args)
+
+    for name in list(blocks):
+        if name not in exec_preds:
+            del blocks[name]
+            continue
+
+        block = blocks[name]
+        for i, instr in enumerate(block):
+            op = instr.get('op')
+
+            # Drop phi arguments along edges that never execute.
+            if op == 'phi':
+                pairs = [(label, arg) for label, arg
+                         in zip(instr['labels'], instr['args'])
+                         if label in exec_preds[name]]
+                instr['labels'] = [p[0] for p in pairs]
+                instr['args'] = [p[1] for p in pairs]
+                if len(pairs) == 1:
+                    block[i] = instr = {
+                        'op': 'id',
+                        'dest': instr['dest'],
+                        'type': instr['type'],
+                        'args': instr['args'],
+                    }
+
+            if 'dest' in instr and op != 'const':
+                val = values.get(instr['dest'], TOP)
+                if val is not TOP and val is not BOTTOM:
+                    block[i] = {
+                        'op': 'const',
+                        'dest': instr['dest'],
+                        'type': instr['type'],
+                        'value': val,
+                    }
+
+            elif op == 'br':
+                taken = [label for label in instr['labels']
+                         if name in exec_preds.get(label, ())]
+                if len(taken) == 1:
+                    block[i] = {'op': 'jmp', 'labels': taken}
+
+    func['instrs'] = reassemble(blocks)
+
+
+def sccp(bril):
+    for func in bril['functions']:
+        func_sccp(func)
+    return bril
+
+
+if __name__ == '__main__':
+    dump_json(sccp(load_json()))
@@ -0,0 +1,67 @@
+"""Compare the phi-node placement modes of `to_ssa.py` on a corpus of
+Bril programs.
+
+Usage: python ssa_bench.py [-v] FILE.bril...
+
+Convert every function of every program to SSA form in each mode (see
+`to_ssa.MODES`), count the phi-nodes, and time the conversion (the best
+of `REPEAT` runs). Print the totals for each mode and, with `-v`, the
+phi-node counts for every program.
+"""
+import copy
+import sys
+import time
+
+from to_ssa import MODES, func_to_ssa
+
+REPEAT = 3
+
+
+def convert(bril, mode):
+    """Convert a copy of a program to SSA form. Return the number of
+    phi-nodes and the time spent converting it.
+    """
+    best = None
+    for _ in range(REPEAT):
+        prog = copy.deepcopy(bril)
+        start = time.perf_counter()
+        for func in prog['functions']:
+            func_to_ssa(func, mode=mode)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    phis = sum(1 for func in prog['functions'] for instr in func['instrs']
+               if instr.get('op') == 'phi')
+    return phis, best
+
+
+def main():
+    import briltxt
+
+    args = sys.argv[1:]
+    verbose = '-v' in args
+    paths = [a for a in args if a != '-v']
+
+    totals = {mode: [0, 0.0] for mode in MODES}
+    if verbose:
+        print('{:<32}'.format('program') +
+              ''.join('{:>10}'.format(mode) for mode in MODES))
+    for path in paths:
+        with open(path) as f:
+            bril = briltxt.parse_program(f.read())
+        counts = []
+        for mode in MODES:
+            phis, secs = convert(bril, mode)
+            totals[mode][0] += phis
+            totals[mode][1] += secs
+            counts.append(phis)
+        if verbose:
+            print('{:<32}'.format(path.split('/')[-1]) +
+                  ''.join('{:>10}'.format(n) for n in counts))
+
+    print('{:<10} {:>10} {:>10}'.format('mode', 'phis', 'time (ms)'))
+    for mode, (phis, secs) in totals.items():
+        print('{:<10} {:>10} {:>10.1f}'.format(mode, phis, secs * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,10 @@ local optimization.
 """
 
 import sys
-import json
+from collections import Counter, defaultdict
+
 from form_blocks import form_blocks
-from util import flatten
+from util import flatten, load_json, dump_json
 
 
 def trivial_dce_pass(func):
@@ -46,12 +47,43 @@ def trivial_dce_pass(func):
 
 
 def trivial_dce(func):
-    """Iteratively remove dead instructions, stopping when nothing
-    remains to remove.
+    """Remove dead instructions transitively, stopping when nothing
+    remains to remove. Return a bool indicating whether we deleted
+    anything.
+
+    This deletes the same instructions as running `trivial_dce_pass`
+    until it changes nothing, but in a single linear pass: we count the
+    uses of every variable and keep a worklist of definitions whose
+    variable has no uses left. Deleting a definition decrements the
+    counts for its arguments, which may add more definitions to the
+    worklist.
     """
-    # An exercise for the reader: prove that this loop terminates.
-    while trivial_dce_pass(func):
-        pass
+    instrs = func['instrs']
+
+    uses = Counter()
+    defs = defaultdict(list)
+    for i, instr in enumerate(instrs):
+        uses.update(instr.get('args', []))
+        if 'dest' in instr:
+            defs[instr['dest']].append(i)
+
+    dead = [i for var, sites in defs.items() if not uses[var]
+            for i in sites]
+    deleted = set()
+    while dead:
+        i = dead.pop()
+        if i in deleted:
+            continue
+        deleted.add(i)
+        for arg in instrs[i].get('args', []):
+            uses[arg] -= 1
+            if not uses[arg]:
+                dead += defs[arg]
+
+    if deleted:
+        func['instrs'] = [instr for i, instr in enumerate(instrs)
+                          if i not in deleted]
+    return bool(deleted)
 
 
 def drop_killed_local(block):
@@ -108,7 +140,8 @@ def drop_killed_pass(func):
 def trivial_dce_plus(func):
     """Like `trivial_dce`, but also deletes locally killed instructions.
     """
-    while trivial_dce_pass(func) or drop_killed_pass(func):
+    trivial_dce(func)
+    while drop_killed_pass(func) | trivial_dce(func):
         pass
 
 
@@ -127,10 +160,10 @@ def localopt():
         modify_func = trivial_dce
 
     # Apply the change to all the functions in the input program.
-    bril = json.load(sys.stdin)
+    bril = load_json()
     for func in bril['functions']:
         modify_func(func)
-    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+    dump_json(bril)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,29 @@
-import json
+"""Convert Bril functions to SSA form.
+
+    bril2json < prog.bril | python to_ssa.py [MODE]
+
+Phi-nodes go at the iterated dominance frontier of every assignment
+(Cytron et al.), which we find from the dominator tree (Sreedhar and
+Gao; see `dom.iterated_fronts`). The MODE decides which variables get
+them:
+
+- minimal: Every variable, wherever its assignments meet, even if it is
+  dead there. This is the default.
+- semi: Only variables that are live across some block boundary (read in
+  a block before any assignment in that block). Temporaries that never
+  leave their block get no phi-nodes at all (Briggs et al.).
+- pruned: Only where the variable is live on entry to the block, which
+  takes a liveness analysis but leaves no dead phi-nodes.
+"""
+
 import sys
 from collections import defaultdict
 
-from cfg import block_map, successors, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
-from dom import get_dom, dom_fronts, dom_tree
+from cfg import CFG, reassemble
+from df import ANALYSES, df_bitvector, union, use
+from dom import iterated_fronts
+from traversal import walk_tree
+from util import load_json, dump_json
 
 
 def def_blocks(blocks):
@@ -18,24 +37,22 @@ def def_blocks(blocks):
     return dict(out)
 
 
-def get_phis(blocks, df, defs):
-    """Find where to insert phi-nodes in the blocks.
+def get_phis(blocks, cfg, defs, live=None):
+    """Find where to insert phi-nodes in the blocks: the iterated
+    dominance frontier of every variable's assignments.
 
     Produce a map from block names to variable names that need phi-nodes
     in those blocks. (We will need to generate names and actually insert
-    instructions later.)
+    instructions later.) If `live` is given, it maps every block to the
+    variables that may need phi-nodes there; the rest are skipped.
     """
     phis = {b: set() for b in blocks}
+    dj = cfg.dj_graph
     for v, v_defs in defs.items():
-        v_defs_list = list(v_defs)
-        for d in v_defs_list:
-            for block in df[d]:
-                # Add a phi-node...
-                if v not in phis[block]:
-                    # ..unless we already did.
-                    phis[block].add(v)
-                    if block not in v_defs_list:
-                        v_defs_list.append(block)
+        for i in iterated_fronts([cfg.ids[d] for d in v_defs], *dj):
+            block = cfg.names[i]
+            if live is None or v in live[block]:
+                phis[block].add(v)
     return phis
 
 
@@ -48,46 +65,48 @@ def ssa_rename(blocks, phis, succ, domtree, args):
     def _push_fresh(var):
         fresh = '{}.{}'.format(var, counters[var])
         counters[var] += 1
-        stack[var].insert(0, fresh)
+        stack[var].append(fresh)
         return fresh
 
     def _rename(block):
-        # Save stacks.
-        old_stack = {k: list(v) for k, v in stack.items()}
-
         # Rename phi-node destinations.
-        for p in phis[block]:
+        pushed = list(phis[block])
+        for p in pushed:
             phi_dests[block][p] = _push_fresh(p)
 
         for instr in blocks[block]:
             # Rename arguments in normal instructions.
             if 'args' in instr:
-                new_args = [stack[arg][0] for arg in instr['args']]
+                new_args = [stack[arg][-1] for arg in instr['args']]
                 instr['args'] = new_args
 
             # Rename destinations.
             if 'dest' in instr:
+                pushed.append(instr['dest'])
                 instr['dest'] = _push_fresh(instr['dest'])
 
         # Rename phi-node arguments (in successors).
         for s in succ[block]:
             for p in phis[s]:
                 if stack[p]:
-                    phi_args[s][p].append((block, stack[p][0]))
+                    phi_args[s][p].append((block, stack[p][-1]))
                 else:
                     # The variable is not defined on this path
                     phi_args[s][p].append((block, "__undefined"))
 
-        # Recursive calls.
-        for b in sorted(domtree[block]):
-            _rename(b)
-
-        # Restore stacks.
-        stack.clear()
-        stack.update(old_stack)
+        return pushed
 
+    # Walk the dominator tree, popping the names a block pushed when
+    # leaving its subtree.
+    children = {b: sorted(domtree[b]) for b in blocks}
     entry = list(blocks.keys())[0]
-    _rename(entry)
+    pushed = {}
+    for block, entering in walk_tree(children, entry):
+        if entering:
+            pushed[block] = _rename(block)
+        else:
+            for var in pushed.pop(block):
+                stack[var].pop()
 
     return phi_args, phi_dests
 
@@ -116,31 +135,59 @@ def get_types(func):
     return types
 
 
-def func_to_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
-    succ = {name: successors(block[-1]) for name, block in blocks.items()}
-    dom = get_dom(succ, list(blocks.keys())[0])
+def semi_pruned(blocks):
+    """Get the variables that may need phi-nodes for semi-pruned SSA:
+    the ones that are read in some block before being assigned there.
+    The same set applies to every block.
+    """
+    names = union(use(block) for block in blocks.values())
+    return {b: names for b in blocks}
+
+
+def pruned(blocks):
+    """Get the variables that may need phi-nodes for pruned SSA: the
+    ones that are live on entry to each block.
+    """
+    live_in, _ = df_bitvector(blocks, ANALYSES['live'])
+    return {b: live_in.get(b, set()) for b in blocks}
+
+
+# Ways to choose the variables that get phi-nodes, from a block map.
+MODES = {
+    'minimal': None,
+    'semi': semi_pruned,
+    'pruned': pruned,
+}
+
+
+def func_to_ssa(func, cfg=None, mode='minimal'):
+    """Convert a function to SSA form, optionally reusing a `CFG` that
+    was already built for it. The `mode` is a key in `MODES`.
+    """
+    if cfg is None:
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
+    succ = cfg.succ_map()
 
-    df = dom_fronts(dom, succ)
     defs = def_blocks(blocks)
     types = get_types(func)
     arg_names = {a['name'] for a in func['args']} if 'args' in func else set()
 
-    phis = get_phis(blocks, df, defs)
-    phi_args, phi_dests = ssa_rename(blocks, phis, succ, dom_tree(dom),
+    live = MODES[mode](blocks) if MODES[mode] else None
+    phis = get_phis(blocks, cfg, defs, live)
+    phi_args, phi_dests = ssa_rename(blocks, phis, succ, cfg.dom_tree,
                                      arg_names)
     insert_phis(blocks, phi_args, phi_dests, types)
 
     func['instrs'] = reassemble(blocks)
 
 
-def to_ssa(bril):
+def to_ssa(bril, mode='minimal'):
     for func in bril['functions']:
-        func_to_ssa(func)
+        func_to_ssa(func, mode=mode)
     return bril
 
 
 if __name__ == '__main__':
-    print(json.dumps(to_ssa(json.load(sys.stdin)), indent=2, sort_keys=True))
+    dump_json(to_ssa(load_json(), sys.argv[1] if len(sys.argv) > 1
+                     else 'minimal'))
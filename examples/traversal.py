@@ -0,0 +1,73 @@
+"""Depth-first traversals of graphs and trees with explicit stacks.
+
+A recursive search recurses once per node along the deepest path it
+takes, so machine-generated programs with long chains of blocks (or
+dominator trees that deep) blow through Python's recursion limit. These
+walks keep their own stacks instead, and visit nodes in the same order
+as the obvious recursive versions.
+
+Graphs and trees are given as maps (or lists, for integer nodes) from
+every node to its successors or children.
+"""
+
+
+def dfs(succs, roots, pre=None, post=None):
+    """Search depth-first from each of the `roots` in turn, visiting
+    successors in order and skipping nodes already reached. Call
+    `pre(node)` when first reaching a node and `post(node)` once all of
+    its successors are done. Return the set of nodes reached.
+    """
+    seen = set()
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        if pre:
+            pre(root)
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    if pre:
+                        pre(child)
+                    stack.append((child, iter(succs[child])))
+                    break
+            else:
+                stack.pop()
+                if post:
+                    post(node)
+    return seen
+
+
+def postorder(succs, root):
+    """Get the nodes reachable from `root` in postorder."""
+    out = []
+    dfs(succs, [root], post=out.append)
+    return out
+
+
+def reverse_postorder(succs, root):
+    """Get the nodes reachable from `root` in reverse postorder."""
+    out = postorder(succs, root)
+    out.reverse()
+    return out
+
+
+def walk_tree(children, root):
+    """Walk a tree (such as a dominator tree) depth-first from `root`,
+    entering children in order. Generate `(node, True)` on entering
+    each node and `(node, False)` on leaving it, after its subtree.
+    """
+    yield root, True
+    stack = [(root, iter(children[root]))]
+    while stack:
+        node, rest = stack[-1]
+        for child in rest:
+            yield child, True
+            stack.append((child, iter(children[child])))
+            break
+        else:
+            stack.pop()
+            yield node, False
@@ -0,0 +1,318 @@
+"""Unroll loops in Bril programs in SSA form.
+
+    bril2json < prog.bril | python to_ssa.py | \\
+        python unroll.py [FACTOR [PROFILE]] | python tdce.py
+
+Unrolling a loop by a factor of k chains k copies of its body together,
+so each trip around the loop does k iterations' worth of work. We only
+unroll innermost loops in "while" form: the header decides whether to
+exit, and a single latch jumps back to it. How the copies exit depends
+on what we know about the trip count:
+
+- If the loop counts a constant number of iterations N (see
+  `LoopVars.trip_count`), N mod k iterations are peeled off in front of
+  the loop, and the remaining copies drop their exit tests altogether.
+- Otherwise, if a profile from `profiler.py` (of the program in the
+  form given to this pass) shows the loop running at least k iterations
+  per entry on average, every copy keeps its exit test. Values that
+  leave the loop get phi-nodes in its exit block.
+- Otherwise, the loop is left alone.
+
+The default factor is `FACTOR`, and loops that would grow beyond
+`MAX_SIZE` instructions are skipped.
+"""
+
+import sys
+from collections import OrderedDict
+
+from cfg import CFG, reassemble, drop_fallthroughs
+from indvars import LoopVars, int_consts, is_ssa
+from loops import natural_loops, preheader, add_preheaders
+from profiler import load_profile
+from util import fresh, load_json, dump_json
+
+FACTOR = 4
+
+# The most instructions an unrolled loop may have, counting the copies.
+MAX_SIZE = 200
+
+
+def clone_loop(blocks, body, header, inputs, names, labels, keep_exit):
+    """Copy the blocks of a loop for one iteration.
+
+    `inputs` maps the header's phi-nodes to the variables holding their
+    values on entry to the copy; the copy uses those instead of the
+    phi-nodes. All other variables and labels in the loop get fresh
+    names, drawn from (and added to) the sets `names` and `labels`. If
+    `keep_exit` is false, the copy's header jumps straight into the
+    loop. The copy's latch still jumps to the original header.
+
+    Return the new blocks, in the same order as `body`, and the maps
+    from the loop's variables and labels to the copy's.
+    """
+    lmap = {}
+    for name in body:
+        lmap[name] = fresh(name + '.u', labels)
+        labels.add(lmap[name])
+    vmap = dict(inputs)
+    for name in body:
+        for instr in blocks[name]:
+            if 'dest' in instr and instr['dest'] not in vmap:
+                vmap[instr['dest']] = fresh(instr['dest'] + '.u', names)
+                names.add(vmap[instr['dest']])
+
+    copies = OrderedDict()
+    for name in body:
+        block = []
+        for instr in blocks[name]:
+            if name == header and instr['op'] == 'phi':
+                continue
+            new = dict(instr)
+            if 'dest' in instr:
+                new['dest'] = vmap[instr['dest']]
+            if 'args' in instr:
+                new['args'] = [vmap.get(a, a) for a in instr['args']]
+            if 'labels' in instr:
+                new['labels'] = [lbl if lbl == header and
+                                 instr['op'] != 'phi' else
+                                 lmap.get(lbl, lbl)
+                                 for lbl in instr['labels']]
+            block.append(new)
+
+        if name == header and not keep_exit:
+            inside = [lmap[lbl] for lbl in blocks[name][-1]['labels']
+                      if lbl in lmap]
+            block[-1] = {'op': 'jmp', 'labels': inside}
+        copies[lmap[name]] = block
+    return copies, vmap, lmap
+
+
+def unroll_loop(blocks, lv, factor, trips, names, labels):
+    """Unroll a loop, given its `LoopVars`, by `factor`. If `trips` is
+    the loop's constant trip count, peel the remainder and drop the
+    copies' exit tests. Otherwise, keep them. Return the blocks to lay
+    out before the header and after the loop.
+    """
+    header, latch = lv.header, lv.latches[0]
+    phis = [instr for instr in blocks[header] if instr['op'] == 'phi']
+    back = {phi['dest']: phi['args'][phi['labels'].index(latch)]
+            for phi in phis}
+    keep_exit = trips is None
+
+    def chain(start, values, count, keep_exit, out):
+        # Make `count` copies, starting with the given values for the
+        # phi-nodes, each jumping to the next. The block `start` jumps to
+        # the first one. Produce the last copy's latch and values.
+        links = []
+        last = start
+        for _ in range(count):
+            copies, vmap, lmap = clone_loop(blocks, lv.body, header, values,
+                                            names, labels, keep_exit)
+            out.update(copies)
+            links.append((last, lmap[header]))
+            exits.append((lmap[header], vmap))
+            last = lmap[latch]
+            values = {d: vmap.get(arg, arg) for d, arg in back.items()}
+
+        # Only link the copies up now, so they all copy the original
+        # jump back to the header.
+        for pred, target in links:
+            term = (out[pred] if pred in out else blocks[pred])[-1]
+            term['labels'] = [target if lbl == header else lbl
+                              for lbl in term['labels']]
+        return last, values
+
+    def reroute(pred, last, values):
+        # Make the phi-nodes take the values on the edge from `pred`
+        # from the block `last` instead.
+        for phi in phis:
+            pairs = zip(phi['labels'], phi['args'])
+            pairs = [(last, values[phi['dest']]) if lbl == pred
+                     else (lbl, arg) for lbl, arg in pairs]
+            phi['labels'] = [lbl for lbl, _ in pairs]
+            phi['args'] = [arg for _, arg in pairs]
+
+    # The peeled iterations, which start with the preheader's values.
+    before = OrderedDict()
+    exits = []
+    if trips is not None and trips % factor:
+        init = {phi['dest']: phi['args'][phi['labels'].index(lv.pre)]
+                for phi in phis}
+        last, values = chain(lv.pre, init, trips % factor, False, before)
+        reroute(lv.pre, last, values)
+
+    # The unrolled copies follow the original latch.
+    after = OrderedDict()
+    exits = [(header, {})]
+    last, values = chain(latch, back, factor - 1, keep_exit, after)
+    reroute(latch, last, values)
+    if keep_exit:
+        add_exit_phis(blocks, lv, exits, names)
+    return before, after
+
+
+def add_exit_phis(blocks, lv, exits, names):
+    """Merge the values that leave a loop whose unrolled copies keep
+    their exit tests. `exits` lists the headers that now exit, with
+    their maps from the loop's variables to their own. The exit block
+    must have no other predecessors.
+
+    Only the header dominates the exit, so its variables are the only
+    ones that can be used after the loop.
+    """
+    term = blocks[lv.header][-1]
+    exit_ = next(lbl for lbl in term['labels'] if lbl not in lv.body)
+    inside = set(lv.body)
+    types = {instr['dest']: instr['type'] for instr in blocks[lv.header]
+             if 'dest' in instr}
+
+    # Existing phi-nodes in the exit block get the new edges...
+    for instr in blocks[exit_]:
+        if instr['op'] == 'phi':
+            arg = instr['args'][0]
+            instr['labels'] = [h for h, _ in exits]
+            instr['args'] = [vmap.get(arg, arg) for _, vmap in exits]
+
+    # ...and every other value that leaves the loop gets a new one.
+    merged = {}
+    for name, block in blocks.items():
+        if name in inside:
+            continue
+        for instr in block:
+            if name == exit_ and instr['op'] == 'phi':
+                continue
+            for arg in instr.get('args', []):
+                if arg in types and arg not in merged:
+                    merged[arg] = fresh(arg + '.x', names)
+                    names.add(merged[arg])
+    if not merged:
+        return
+
+    phis = [{'op': 'phi', 'dest': new, 'type': types[var],
+             'labels': [h for h, _ in exits],
+             'args': [vmap.get(var, var) for _, vmap in exits]}
+            for var, new in merged.items()]
+    for name, block in blocks.items():
+        if name in inside:
+            continue
+        for instr in block:
+            if 'args' in instr and \
+               not (name == exit_ and instr['op'] == 'phi'):
+                instr['args'] = [merged.get(a, a) for a in instr['args']]
+    blocks[exit_][:0] = phis
+
+
+def loop_size(blocks, lv):
+    """Count the instructions in a loop."""
+    return sum(len(blocks[name]) for name in lv.body)
+
+
+def can_unroll(blocks, cfg, loop, lv, loops):
+    """Check whether a loop is an innermost loop in "while" form."""
+    if len(loop.latches) != 1 or loop.latches[0] == loop.header:
+        return False
+    if any(other.header in loop.body and other is not loop
+           for other in loops):
+        return False
+    term = blocks[lv.header][-1]
+    if term['op'] != 'br' or \
+       sum(1 for s in cfg.succs[loop.header] if s not in loop.body) != 1:
+        return False
+    if any(s not in loop.body for b in loop.body if b != loop.header
+           for s in cfg.succs[b]):
+        return False
+    latch = blocks[lv.latches[0]][-1]
+    return latch['op'] == 'jmp'
+
+
+def average_trips(counts, lv):
+    """Compute the average number of iterations per entry to a loop from
+    a profile's `Counts`, or return None if it never ran. (The profile
+    may predate the loop's preheader, so we count entries as the
+    header's executions that did not come from the latch.)
+    """
+    header = lv.header
+    entries = counts.blocks[header] - counts.edges[lv.latches[0], header]
+    if entries <= 0:
+        return None
+    term = lv.blocks[header][-1]
+    inside = sum(counts.edges[header, lbl] for lbl in term['labels']
+                 if lbl in lv.body)
+    return inside / entries
+
+
+def unroll_func(func, factor=FACTOR, counts=None):
+    """Unroll the loops in an SSA function by `factor`, optionally using
+    the function's `Counts` from a profile. Functions that are not in
+    SSA form are left alone. Return the number of loops unrolled.
+    """
+    if factor < 2 or not is_ssa(func):
+        return 0
+    original = [dict(instr) for instr in func['instrs']]
+    cfg = CFG(func)
+    if add_preheaders(func, cfg):
+        cfg = CFG(func)
+    blocks = cfg.blocks(func)
+    consts = int_consts(func)
+    names = {a['name'] for a in func.get('args', [])}
+    defs = {}
+    for instr in func['instrs']:
+        if 'dest' in instr:
+            names.add(instr['dest'])
+            defs[instr['dest']] = instr
+    labels = set(blocks)
+
+    loops = [loop for loop in natural_loops(cfg)
+             if preheader(cfg, loop) is not None]
+    before, after = {}, {}  # Blocks to lay out around existing ones.
+    for loop in loops:
+        lv = LoopVars(blocks, cfg, loop, consts, names)
+        if not can_unroll(blocks, cfg, loop, lv, loops) or \
+           loop_size(blocks, lv) * factor > MAX_SIZE:
+            continue
+        trips = lv.trip_count(defs)
+        if trips is None:
+            average = average_trips(counts, lv) if counts is not None else None
+            exit_ = next(s for s in cfg.succs[loop.header]
+                         if s not in loop.body)
+            if average is None or average < factor or \
+               cfg.preds[exit_] != [loop.header]:
+                continue
+        elif trips < factor:
+            continue
+
+        last = max(lv.body, key=cfg.ids.get)
+        before[lv.header], after[last] = unroll_loop(
+            blocks, lv, factor, trips, names, labels,
+        )
+
+    if not before:
+        func['instrs'] = original
+        return 0
+
+    new = OrderedDict()
+    for name, block in blocks.items():
+        new.update(before.get(name, {}))
+        new[name] = block
+        new.update(after.get(name, {}))
+    func['instrs'] = reassemble(new)
+    drop_fallthroughs(func)
+    return len(before)
+
+
+def unroll(bril, factor=FACTOR, profile=None):
+    """Unroll loops throughout a program, optionally guided by a profile
+    (a map from function names to `Counts`).
+    """
+    for func in bril['functions']:
+        counts = None
+        if profile is not None:
+            counts = profile.get(func['name'])
+        unroll_func(func, factor, counts)
+    return bril
+
+
+if __name__ == '__main__':
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else FACTOR
+    profile = load_profile(sys.argv[2]) if len(sys.argv) > 2 else None
+    dump_json(unroll(load_json(), factor, profile))
@@ -1,4 +1,22 @@
 import itertools
+import json
+import os
+import re
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Like `bril2json`, every pass emits compact (unindented, unsorted) JSON
+# when this environment variable is set. Use it in long pipelines where
+# nobody reads the intermediate programs.
+COMPACT_VAR = 'BRIL_COMPACT_JSON'
+
+# Integer literals this long might not fit in 64 bits, which `orjson`
+# would quietly decode as floats.
+WIDE_INT_RE = re.compile(r'\d{19}')
 
 
 def flatten(ll):
@@ -16,3 +34,55 @@ def fresh(seed, names):
         if name not in names:
             return name
         i += 1
+
+
+def wrap_int(n):
+    """Wrap an integer to a signed 64-bit value, like the interpreter.
+    """
+    return (n + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+def div_int(a, b):
+    """Integer division that truncates toward zero, like the interpreter.
+    """
+    q = abs(a) // abs(b)
+    return wrap_int(q if (a < 0) == (b < 0) else -q)
+
+
+def load_json(file=None):
+    """Read a JSON Bril program from a file (standard input by default),
+    using the fast `orjson` decoder if it is installed. Programs that
+    `orjson` cannot decode faithfully (ones with `Infinity` or `NaN`
+    floats, or integers that might not fit in 64 bits) go to the
+    standard library decoder instead.
+    """
+    text = (file or sys.stdin).read()
+    if orjson and not WIDE_INT_RE.search(text):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def dump_json(bril, file=None):
+    """Write a Bril program as JSON to a file (standard output by
+    default). The output is pretty-printed unless compact mode is on.
+    """
+    file = file or sys.stdout
+    if os.environ.get(COMPACT_VAR, '') in ('', '0'):
+        text = json.dumps(bril, indent=2, sort_keys=True)
+    else:
+        text = None
+        if orjson:
+            try:
+                text = orjson.dumps(bril).decode()
+            except TypeError:  # Integers that don't fit in 64 bits.
+                pass
+            # `orjson` writes infinite and NaN floats as `null`, which
+            # Bril never uses otherwise.
+            if text and 'null' in text:
+                text = None
+        if text is None:
+            text = json.dumps(bril, separators=(',', ':'))
+    print(text, file=file)
@@ -112,3 +112,90 @@ class DataflowAnalysis:
 
 
         return in_, out, list(succs.keys())
+
+
+class BitVectorAnalysis(DataflowAnalysis):
+    """
+    A gen/kill analysis solved with bit vectors. Every fact that appears in
+    init_set, gen, or kill is interned to a bit position, and flow values
+    are Python ints, so merge is a single `|` and transfer never builds a
+    set. Subclasses only provide init_set, gen, kill, and is_forward.
+    """
+    def merge_bits(self, flow_in_bits):
+        result = 0
+        for bits in flow_in_bits:
+            result |= bits
+        return result
+
+    def intern(self, func, blocks):
+        facts = list(self.init_set(func))
+        for block in blocks:
+            for instr in block:
+                facts.extend(self.gen(instr))
+                facts.extend(self.kill(instr))
+        facts = list(dict.fromkeys(facts))
+        return facts, {fact: i for i, fact in enumerate(facts)}
+
+    def to_bits(self, facts, index):
+        bits = 0
+        for fact in facts:
+            bits |= 1 << index[fact]
+        return bits
+
+    def from_bits(self, bits, facts):
+        result = set()
+        while bits:
+            low = bits & -bits
+            result.add(facts[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def block_gen_kill(self, block, index):
+        """
+        Compose the per-instruction gen/kill sets of a block into a single
+        (gen, kill) pair of bit vectors.
+        """
+        block = block if self.is_forward() else block[::-1]
+        gen, kill = 0, 0
+        for instr in block:
+            g = self.to_bits(self.gen(instr), index)
+            k = self.to_bits(self.kill(instr), index)
+            gen = g | (gen & ~k)
+            kill |= k
+        return gen, kill
+
+    def worklist_algorithm(self, func):
+        instrs = func['instrs']
+        blocks = list(self.form_blocks(instrs))
+        block_map, preds, succs = self.form_cfg(blocks)
+        facts, index = self.intern(func, blocks)
+
+        gen, keep = {}, {}
+        for label, block in block_map.items():
+            g, k = self.block_gen_kill(block, index)
+            gen[label], keep[label] = g, ~k
+
+        init = self.to_bits(self.init_set(func), index)
+        in_ = {block[0]['label']: init for block in blocks}
+        out = {block[0]['label']: init for block in blocks}
+
+        if self.is_forward():
+            flow_in, flow_out = in_, out
+        else:
+            flow_in, flow_out = out, in_
+            preds, succs = succs, preds
+
+        worklist = collections.deque(succs.keys())
+        while worklist:
+            block = worklist.popleft()
+            flow_in[block] = self.merge_bits([flow_out[pred]
+                                              for pred in preds[block]])
+            transferred = gen[block] | (flow_in[block] & keep[block])
+            if flow_out[block] != transferred:
+                flow_out[block] = transferred
+                for succ in succs[block]:
+                    worklist.append(succ)
+
+        in_ = {label: self.from_bits(v, facts) for label, v in in_.items()}
+        out = {label: self.from_bits(v, facts) for label, v in out.items()}
+        return in_, out, list(succs.keys())
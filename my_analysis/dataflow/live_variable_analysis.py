@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-from dataflow_abstract import DataflowAnalysis
+from dataflow_abstract import BitVectorAnalysis
 
-class LiveVariableAnalysis(DataflowAnalysis):
+class LiveVariableAnalysis(BitVectorAnalysis):
     """
     This implementation does not distinguish reassignment.
     """
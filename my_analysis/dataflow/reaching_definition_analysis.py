@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-from dataflow_abstract import DataflowAnalysis
+from dataflow_abstract import BitVectorAnalysis
 
-class ReachingDefinitionAnalysis(DataflowAnalysis):
+class ReachingDefinitionAnalysis(BitVectorAnalysis):
     """
     This implementation does not distinguish assignment over the same variable.
     """